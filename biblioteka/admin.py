@@ -97,7 +97,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'isbn', 'publication_year', 'language', 'created_at']
+    list_display = ['title', 'authors_display', 'isbn', 'publication_year', 'language', 'available_count', 'created_at']
     list_filter = ['language', 'publication_year']
     search_fields = ['title', 'isbn', 'description']
 
@@ -159,10 +159,12 @@ class BookReviewAdmin(admin.ModelAdmin):
 
 @admin.register(BookQueue)
 class BookQueueAdmin(admin.ModelAdmin):
-    list_display = ['user', 'book', 'branch', 'position', 'status', 'created_at']
+    list_display = ['user', 'book', 'branch', 'sequence', 'status', 'held_branch', 'created_at']
     list_filter = ['status', 'branch']
+    readonly_fields = ['held_branch', 'notified_at']
     search_fields = ['user__username', 'book__title']
-    list_editable = ['status', 'position']
+    list_editable = ['status', 'sequence']
+    ordering = ['book', 'sequence']
 
 
 # Настройки админ-панели
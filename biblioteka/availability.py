@@ -0,0 +1,179 @@
+# biblioteka/availability.py
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .models import RoomBooking
+
+
+# Слоты по умолчанию: шаг 1 час с 08:00 до 17:00
+DEFAULT_START_HOUR = 8
+DEFAULT_END_HOUR = 17
+
+# Наибольший диапазон дат для календаря
+MAX_RANGE_DAYS = 31
+
+
+def build_slots(start_hour=DEFAULT_START_HOUR, end_hour=DEFAULT_END_HOUR, step_minutes=60):
+    """Возвращает список слотов [(start, end), ...] с заданным шагом"""
+    slots = []
+    day = datetime(2000, 1, 1)
+    current = day + timedelta(hours=start_hour)
+    finish = day + timedelta(hours=end_hour)
+    step = timedelta(minutes=step_minutes)
+    while current + step <= finish:
+        slots.append((current.time(), (current + step).time()))
+        current += step
+    return slots
+
+
+def occupied_by_slot(slots, intervals):
+    """
+    Sweep-line по интервалам броней.
+    slots - отсортированные непересекающиеся слоты [(start, end), ...]
+    intervals - итерируемое [(start_time, end_time, seats), ...]
+    Возвращает список занятых мест для каждого слота.
+    Бронь занимает слот, если start < slot_end и end > slot_start.
+    """
+    starts = [s for s, _ in slots]
+    ends = [e for _, e in slots]
+    diff = [0] * (len(slots) + 1)
+
+    for start, end, seats in intervals:
+        first = bisect_right(ends, start)
+        last = bisect_left(starts, end)
+        if first < last:
+            diff[first] += seats
+            diff[last] -= seats
+
+    occupied = []
+    running = 0
+    for i in range(len(slots)):
+        running += diff[i]
+        occupied.append(running)
+    return occupied
+
+
+def covered_slots(slots, start_time, end_time):
+    """Слоты, которые занимает интервал (то же правило, что в occupied_by_slot)"""
+    first = bisect_right([e for _, e in slots], start_time)
+    last = bisect_left([s for s, _ in slots], end_time)
+    return slots[first:last]
+
+
+def rooms_availability(rooms, booking_date):
+    """
+    Свободные места по слотам для набора залов на дату.
+    Слоты строятся по расписанию каждого зала (biblioteka.schedules).
+    Занятость берется из кэша в памяти, сверенного с версиями броней филиалов;
+    отсутствующие и устаревшие залы загружаются одним запросом.
+    Возвращает данные в формате /api/availability/.
+    """
+    from .occupancy import occupancy_cache
+    from .schedules import room_schedules
+
+    rooms = list(rooms)
+    schedules = room_schedules(room.id for room in rooms)
+    room_slots = {room.id: list(schedules[room.id].slots_for(booking_date)) for room in rooms}
+    occupancy = occupancy_cache.occupied(room_slots, booking_date, {room.id: room.branch_id for room in rooms})
+
+    rooms_data = []
+    for room in rooms:
+        occupied = occupancy[room.id]
+        rooms_data.append({
+            'id': room.id,
+            'name': room.name,
+            'total_seats': room.total_seats,
+            'slot_minutes': schedules[room.id].slot_minutes,
+            'slots': [
+                {
+                    'start': slot_start.strftime("%H:%M"),
+                    'end': slot_end.strftime("%H:%M"),
+                    'free': max(room.total_seats - busy, 0),
+                }
+                for (slot_start, slot_end), busy in zip(room_slots[room.id], occupied)
+            ],
+        })
+    return rooms_data
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def rooms_availability_range(rooms, date_from, date_to):
+    """
+    Свободные места залов по дням и слотам за период [date_from, date_to].
+    Брони периода загружаются одним запросом и раскладываются по матрице
+    зал x день x слот векторно (разностный массив + cumsum по слотам);
+    сетка слотов каждого дня берется из расписания зала.
+    Возвращает {dates, rooms: [{id, name, total_seats, slot_minutes, opens, free}]}, где
+    opens[день] - начало первого слота (None - закрыт), free[день][слот] - свободные места.
+    """
+    from .schedules import room_schedules
+
+    rooms = list(rooms)
+    days = (date_to - date_from).days + 1
+    dates = [date_from + timedelta(days=i) for i in range(days)]
+    room_index = {room.id: i for i, room in enumerate(rooms)}
+    schedules = room_schedules(room_index)
+
+    # Часы работы и число слотов для каждой пары зал x день
+    steps = np.array([schedules[room.id].slot_minutes for room in rooms], dtype=np.int64)
+    opens = np.zeros((len(rooms), days), dtype=np.int64)
+    counts = np.zeros((len(rooms), days), dtype=np.int64)
+    for i, room in enumerate(rooms):
+        for d, day in enumerate(dates):
+            hours = schedules[room.id].hours_for(day)
+            if hours is not None:
+                opens[i, d] = hours[0]
+                counts[i, d] = (hours[1] - hours[0]) // steps[i]
+
+    rows = list(RoomBooking.objects.filter(
+        room_id__in=room_index.keys(),
+        booking_date__range=(date_from, date_to),
+        status='confirmed',
+    ).values_list('room_id', 'booking_date', 'start_time', 'end_time', 'seats_count'))
+
+    diff = np.zeros((len(rooms), days, int(counts.max(initial=0)) + 1), dtype=np.int64)
+    if rows:
+        room_ids, booking_dates, starts, ends, seats = zip(*rows)
+        room_pos = np.fromiter((room_index[room_id] for room_id in room_ids), dtype=np.int64, count=len(rows))
+        day_pos = np.fromiter(((day - date_from).days for day in booking_dates), dtype=np.int64, count=len(rows))
+        start_min = np.fromiter((_minutes(value) for value in starts), dtype=np.int64, count=len(rows))
+        end_min = np.fromiter((_minutes(value) for value in ends), dtype=np.int64, count=len(rows))
+        seats = np.asarray(seats, dtype=np.int64)
+
+        # Те же границы, что в occupied_by_slot: start < slot_end и end > slot_start
+        step = steps[room_pos]
+        day_open = opens[room_pos, day_pos]
+        day_count = counts[room_pos, day_pos]
+        first = np.clip((start_min - day_open) // step, 0, day_count)
+        last = np.clip(-((day_open - end_min) // step), 0, day_count)
+        hit = first < last
+
+        np.add.at(diff, (room_pos[hit], day_pos[hit], first[hit]), seats[hit])
+        np.subtract.at(diff, (room_pos[hit], day_pos[hit], last[hit]), seats[hit])
+
+    occupied = np.cumsum(diff[:, :, :-1], axis=2)
+    totals = np.array([room.total_seats for room in rooms], dtype=np.int64).reshape(-1, 1, 1)
+    free = np.maximum(totals - occupied, 0)
+
+    return {
+        'dates': [day.isoformat() for day in dates],
+        'rooms': [
+            {
+                'id': room.id,
+                'name': room.name,
+                'total_seats': room.total_seats,
+                'slot_minutes': int(steps[i]),
+                'opens': [
+                    f'{opens[i, d] // 60:02d}:{opens[i, d] % 60:02d}' if counts[i, d] else None
+                    for d in range(days)
+                ],
+                'free': [free[i, d, :counts[i, d]].tolist() for d in range(days)],
+            }
+            for i, room in enumerate(rooms)
+        ],
+    }
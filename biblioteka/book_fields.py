@@ -0,0 +1,59 @@
+# biblioteka/book_fields.py
+"""
+Проекция книги для API: клиент выбирает поля параметром fields=, из базы
+читаются только нужные колонки через values(), без создания объектов Book.
+"""
+from .models import Book
+
+
+def _cover_url(name):
+    return Book._meta.get_field('cover_image').storage.url(name) if name else None
+
+
+# Имя поля в ответе -> (колонка Book, преобразование значения или None)
+BOOK_FIELDS = {
+    'id': ('id', None),
+    'title': ('title', None),
+    'authors': ('authors_display', lambda value: value or "Не указан"),
+    'description': ('description', lambda value: value[:300]),  # длина краткого описания
+    'publication_year': ('publication_year', None),
+    'pages': ('pages', None),
+    'language': ('language', None),
+    'isbn': ('isbn', None),
+    'price': ('price', str),
+    'cover_image': ('cover_image', _cover_url),
+    'available_copies': ('available_count', None),
+}
+
+# Поля карточки в сетке каталога
+DEFAULT_FIELDS = ('id', 'title', 'authors', 'description', 'publication_year', 'pages')
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """'title,pages' -> ('id', 'pages', 'title'); id возвращается всегда"""
+    if not value:
+        return DEFAULT_FIELDS
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names - BOOK_FIELDS.keys()
+    if unknown:
+        raise InvalidFields("Unknown fields: " + ", ".join(sorted(unknown)))
+    return tuple(sorted(names | {'id'}))
+
+
+def project(queryset, fields, extra=()):
+    """values()-выборка колонок для fields; extra - дополнительные колонки (ключ сортировки)"""
+    columns = {BOOK_FIELDS[name][0] for name in fields} | set(extra)
+    return queryset.values(*sorted(columns))
+
+
+def serialize(row, fields):
+    item = {}
+    for name in fields:
+        column, convert = BOOK_FIELDS[name]
+        value = row[column]
+        item[name] = convert(value) if convert is not None and value is not None else value
+    return item
@@ -0,0 +1,173 @@
+# biblioteka/book_queue.py
+"""
+Очередь на книгу.
+
+Порядок задается разреженным ключом sequence: новая запись получает ключ
+последней записи книги плюс SEQUENCE_GAP, выход из очереди меняет статус
+только своей строки, без перенумерации остальных. Промежутки между ключами
+позволяют переставить запись (например, в админке), не трогая соседей.
+Место пользователя считается запросом по индексу (book, status, sequence),
+см. BookQueueQuerySet.with_rank.
+
+Постановка в очередь блокирует строку книги, поэтому конкурентные enqueue
+одной книги получают разные ключи.
+
+Уведомление откладывает экземпляр: promote переводит первую ожидающую запись
+в notified, только если inventory.reserve списал свободный экземпляр филиала,
+поэтому уведомленных не больше, чем экземпляров, и отложенный экземпляр не
+уходит чужой брони. Бронь уведомленного (claim в book_book) забирает
+отложенный экземпляр; выход из очереди или истечение HOLD_DAYS возвращают
+его в учет и передают следующему (сигнал на BookQueue).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import inventory
+from .models import Book, BookInventory, BookQueue
+
+
+SEQUENCE_GAP = 1024
+HOLD_DAYS = 3
+ACTIVE_STATUSES = ('waiting', 'notified')
+
+
+class QueueError(Exception):
+    """Ошибка очереди с сообщением для пользователя"""
+
+
+def enqueue(user, book_id, branch_id=None):
+    """
+    Ставит пользователя в конец очереди на книгу (в филиале или в любом).
+    Если экземпляр свободен, очередь сразу продвигается - запись может вернуться уже notified.
+    """
+    with transaction.atomic():
+        # Блокировка книги сериализует выдачу ключей ее очереди
+        if Book.objects.select_for_update().filter(pk=book_id).values_list('pk', flat=True).first() is None:
+            raise QueueError("Книга не найдена")
+
+        entry = BookQueue.objects.select_for_update().filter(
+            user=user, book_id=book_id, branch_id=branch_id
+        ).first()
+        if entry is not None and entry.status in ACTIVE_STATUSES:
+            raise QueueError("Вы уже в очереди на эту книгу")
+
+        tail = BookQueue.objects.filter(book_id=book_id).aggregate(tail=Max('sequence'))['tail'] or 0
+        if entry is None:
+            entry = BookQueue.objects.create(
+                user=user, book_id=book_id, branch_id=branch_id, sequence=tail + SEQUENCE_GAP,
+            )
+        else:
+            # Повторная постановка после выхода - снова в конец
+            entry.status = 'waiting'
+            entry.sequence = tail + SEQUENCE_GAP
+            entry.notified_at = None
+            entry.held_branch = None
+            entry.save(update_fields=['status', 'sequence', 'notified_at', 'held_branch'])
+
+        # Свободный экземпляр (или снятое между проверками удержание) сразу откладывается
+        if branch_id is not None:
+            branches = [branch_id]
+        else:
+            branches = BookInventory.objects.filter(book_id=book_id, available__gt=0).order_by(
+                '-available', 'branch_id'
+            ).values_list('branch_id', flat=True)
+        for candidate in branches:
+            promote(book_id, candidate)
+        entry.refresh_from_db(fields=['status', 'notified_at', 'held_branch'])
+    return entry
+
+
+def dequeue(user, entry_id):
+    """Выход из очереди; отложенный для пользователя экземпляр переходит следующему (сигнал)"""
+    with transaction.atomic():
+        entry = BookQueue.objects.select_for_update().filter(pk=entry_id, user=user).first()
+        if entry is None:
+            raise QueueError("Запись в очереди не найдена")
+        if entry.status not in ACTIVE_STATUSES:
+            raise QueueError("Вы уже не в очереди")
+
+        entry.status = 'cancelled'
+        entry.save(update_fields=['status'])
+    return entry
+
+
+def promote(book_id, branch_id):
+    """
+    Откладывает свободные экземпляры филиала за первыми ожидающими (в филиале или в любом)
+    и переводит их в notified. Вызывается после того, как экземпляр вернулся в учет;
+    возвращает список уведомленных записей.
+    """
+    promoted = []
+    with transaction.atomic():
+        candidates = BookQueue.objects.filter(
+            Q(branch_id=branch_id) | Q(branch__isnull=True), book_id=book_id, status='waiting',
+        )
+        while True:
+            # Занятую конкурентным promote строку пропускаем - ее уже уведомляют
+            head = candidates.select_for_update(skip_locked=True).order_by('sequence').first()
+            if head is None:
+                break
+            try:
+                inventory.reserve(book_id, branch_id)
+            except inventory.InventoryError:
+                # Свободных экземпляров нет: уведомлять некого
+                break
+            head.status = 'notified'
+            head.notified_at = timezone.now()
+            head.held_branch_id = branch_id
+            head.save(update_fields=['status', 'notified_at', 'held_branch'])
+            promoted.append(head)
+    return promoted
+
+
+def release_hold(book_id, branch_id):
+    """Возвращает отложенный экземпляр в учет и передает его следующему в очереди"""
+    with transaction.atomic():
+        inventory.release(book_id, branch_id)
+        promote(book_id, branch_id)
+
+
+def claim(user, book_id):
+    """
+    Бронь уведомленного пользователя: запись завершается, отложенный экземпляр
+    (уже в reserved) переходит брони. Возвращает филиал экземпляра или None.
+    Вызывается в транзакции брони.
+    """
+    entry = BookQueue.objects.select_for_update().filter(
+        user=user, book_id=book_id, status='notified', held_branch__isnull=False,
+    ).order_by('sequence').first()
+    if entry is None:
+        return None
+    entry.status = 'completed'
+    entry.save(update_fields=['status'])
+    return entry.held_branch_id
+
+
+def hold_deadline(entry):
+    """До какого времени экземпляр отложен за уведомленным"""
+    return entry.notified_at + timedelta(days=HOLD_DAYS) if entry.notified_at else None
+
+
+def expire_holds(now=None):
+    """Снимает отложенные экземпляры, не забронированные за HOLD_DAYS; возвращает количество"""
+    now = now or timezone.now()
+    stale = BookQueue.objects.filter(status='notified', notified_at__lt=now - timedelta(days=HOLD_DAYS))
+    expired = 0
+    for entry_id in list(stale.values_list('pk', flat=True)):
+        with transaction.atomic():
+            # Запись могли забронировать или отменить после выборки
+            entry = stale.select_for_update(skip_locked=True).filter(pk=entry_id).first()
+            if entry is None:
+                continue
+            entry.status = 'cancelled'
+            entry.save(update_fields=['status'])
+            expired += 1
+    return expired
+
+
+def user_entries(user):
+    """Активные записи пользователя с местом в очереди (rank), уведомленные первыми"""
+    return BookQueue.objects.filter(user=user, status__in=ACTIVE_STATUSES).with_rank().order_by('status', 'sequence')
@@ -0,0 +1,63 @@
+# biblioteka/book_summary.py
+"""
+Синхронизация денормализованных полей Book.authors_display и Book.available_count.
+Все функции принимают список id книг (None - все книги) и не вызывают сигналы.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Book, BookAuthor, available_copies_expression
+
+
+CHUNK_SIZE = 2000
+
+
+def format_authors(names):
+    """Строка авторов в том виде, в каком она показывается в списках"""
+    return ", ".join(name for name in names if name)
+
+
+def _chunks(book_ids):
+    if book_ids is None:
+        book_ids = Book.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=CHUNK_SIZE)
+    chunk = []
+    for book_id in book_ids:
+        chunk.append(book_id)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def refresh_authors_display(book_ids=None):
+    """Пересчитывает authors_display: один запрос авторов и один UPDATE-пакет на порцию книг"""
+    updated = 0
+    for chunk in _chunks(book_ids):
+        names = defaultdict(list)
+        rows = BookAuthor.objects.filter(book_id__in=chunk).order_by('id').values_list('book_id', 'author__full_name')
+        for book_id, full_name in rows:
+            names[book_id].append(full_name)
+
+        books = [Book(id=book_id, authors_display=format_authors(names[book_id])[:1000]) for book_id in chunk]
+        with transaction.atomic():
+            Book.objects.bulk_update(books, ['authors_display'], batch_size=500)
+        updated += len(books)
+    return updated
+
+
+def refresh_available_count(book_ids=None):
+    """Пересчитывает available_count одним UPDATE с подзапросом на порцию книг"""
+    if book_ids is None:
+        return Book.objects.update(available_count=available_copies_expression())
+
+    updated = 0
+    for chunk in _chunks(book_ids):
+        updated += Book.objects.filter(id__in=chunk).update(available_count=available_copies_expression())
+    return updated
+
+
+def refresh_books(book_ids=None):
+    refresh_authors_display(book_ids)
+    refresh_available_count(book_ids)
@@ -0,0 +1,182 @@
+# biblioteka/catalog_cache.py
+"""
+Кэш ответов /api/books/.
+
+Ключ строится из нормализованного набора фильтров и версий "областей", от
+которых зависит состав выдачи (филиал, жанр, поиск, весь каталог). Запись
+дополнительно хранит версии попавших в нее книг и при чтении сверяет их,
+поэтому изменение одной книги сбрасывает только страницы, где она есть.
+Версии - случайные токены в таблице CatalogVersion, общей для веб-процессов
+и процесса clock: запись в любом процессе сбрасывает кэш во всех. Области без
+строки имеют начальную версию, поэтому чтение ничего не пишет в базу.
+Из тех же версий строятся ETag ответов API (см. etag), в том числе для залов.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import CatalogVersion
+
+
+CACHE_ALIAS = 'catalog'
+KEY_PREFIX = 'catalog'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+INITIAL_TOKEN = '0'
+
+
+def _versions(names):
+    """Текущие версии ключей одним запросом; области без строки - INITIAL_TOKEN"""
+    names = [name[:255] for name in names]
+    if not names:
+        return []
+    found = dict(CatalogVersion.objects.filter(name__in=set(names)).values_list('name', 'token'))
+    return [found.get(name, INITIAL_TOKEN) for name in names]
+
+
+def versions(names):
+    """Версии областей для кэшей других модулей (залы, расписания, подсказки)"""
+    return _versions(list(names))
+
+
+def bump(*names):
+    """Сбрасывает версии после фиксации транзакции"""
+    if not names:
+        return
+    versions = [CatalogVersion(name=name[:255], token=_new_token()) for name in dict.fromkeys(names)]
+    transaction.on_commit(lambda: CatalogVersion.objects.bulk_create(
+        versions, update_conflicts=True, unique_fields=['name'], update_fields=['token'],
+    ))
+
+
+def normalize_filters(branch, genre, search, cursor, limit, fields=()):
+    """Кортеж фильтров, одинаковый для эквивалентных запросов"""
+    branch = str(branch).strip() if branch and branch != 'all' else 'all'
+    genre = str(genre).strip() if genre and genre != 'all' else 'all'
+    search = ' '.join((search or '').lower().split())
+    return branch, genre, search, cursor or '', limit, tuple(fields)
+
+
+def _scopes(filters):
+    branch, genre, search = filters[:3]
+    scopes = []
+    if branch != 'all':
+        scopes.append(f'branch:{branch}')
+    if genre != 'all':
+        # Жанр включает поджанры, поэтому зависит и от дерева категорий
+        scopes += [f'genre:{genre}', 'categories']
+    if branch == 'all' and genre == 'all':
+        scopes.append('all')
+    if search:
+        scopes.append('search')
+    return scopes
+
+
+def _entry_key(filters):
+    scopes = _scopes(filters)
+    raw = repr((filters, scopes, _versions(scopes)))
+    return f'{KEY_PREFIX}:page:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _hash_etag(*parts):
+    return '"%s"' % hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def get(filters):
+    """Возвращает (закэшированный ответ или None, ключ записи, ETag записи или None)"""
+    key = _entry_key(filters)
+    entry = _cache().get(key)
+    if entry is not None:
+        book_ids = list(entry['books'])
+        current = _versions(f'book:{book_id}' for book_id in book_ids)
+        if current == [entry['books'][book_id] for book_id in book_ids]:
+            _count('hits')
+            return entry['payload'], key, _hash_etag(key, current)
+    _count('misses')
+    return None, key, None
+
+
+def put(key, payload, book_ids):
+    """Сохраняет страницу и возвращает ее ETag"""
+    book_ids = list(book_ids)
+    versions = _versions(f'book:{book_id}' for book_id in book_ids)
+    _cache().set(key, {'payload': payload, 'books': dict(zip(book_ids, versions))})
+    return _hash_etag(key, versions)
+
+
+def etag(name, params, scopes):
+    """
+    Сильный ETag ответа, который зависит только от версий областей scopes.
+    Считается одним запросом к CatalogVersion, поэтому проверка If-None-Match дешевая.
+    """
+    return _hash_etag(name, params, scopes, _versions(scopes))
+
+
+def combine_etags(*etags):
+    return _hash_etag(*etags)
+
+
+def get_scoped(name, params, scopes):
+    """
+    Запись, зависящая только от версий областей scopes (без проверки книг).
+    Возвращает (значение или None, ключ записи).
+    """
+    raw = repr((params, scopes, _versions(scopes)))
+    key = f'{KEY_PREFIX}:{name}:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    value = _cache().get(key)
+    _count('misses' if value is None else 'hits')
+    return value, key
+
+
+def put_scoped(key, value):
+    _cache().set(key, value)
+
+
+def get_facets(filters):
+    """
+    Счетчики фильтров кэшируются отдельно от страниц: они зависят от всего
+    каталога и сбрасываются областью 'facets' при любом изменении состава.
+    """
+    branch, genre, search = filters[:3]
+    scopes = ['facets', 'search'] if search else ['facets']
+    return get_scoped('facets', (branch, genre, search), scopes)
+
+
+put_facets = put_scoped
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """Счетчики попаданий и промахов текущего процесса"""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
@@ -0,0 +1,42 @@
+# biblioteka/categories.py
+from . import catalog_cache
+from .models import Category
+
+
+def build_category_tree():
+    """Дерево категорий одним запросом: сортировка по пути дает родителей раньше детей"""
+    nodes = {}
+    roots = []
+    rows = Category.objects.order_by('path').values_list('id', 'name', 'parent_id', 'depth')
+    for category_id, name, parent_id, depth in rows:
+        node = {'id': category_id, 'name': name, 'depth': depth, 'children': []}
+        nodes[category_id] = node
+        parent = nodes.get(parent_id)
+        if parent is not None:
+            parent['children'].append(node)
+        else:
+            roots.append(node)
+    for node in nodes.values():
+        node['children'].sort(key=lambda child: child['name'])
+    roots.sort(key=lambda root: root['name'])
+    return roots
+
+
+def category_tree():
+    """Закэшированное дерево категорий; сбрасывается при изменении любой категории"""
+    tree, key = catalog_cache.get_scoped('categories', None, ['categories'])
+    if tree is None:
+        tree = build_category_tree()
+        catalog_cache.put_scoped(key, tree)
+    return tree
+
+
+def flatten_tree(tree):
+    """Категории в порядке обхода дерева - для выпадающих списков"""
+    result = []
+    stack = list(reversed(tree))
+    while stack:
+        node = stack.pop()
+        result.append(node)
+        stack.extend(reversed(node['children']))
+    return result
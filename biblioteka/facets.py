@@ -0,0 +1,64 @@
+# biblioteka/facets.py
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Book, Branch, BookCategory, BookCopy, Category
+
+
+def filter_by_branch(books, branch_id):
+    if _is_set(branch_id):
+        books = books.filter(id__in=BookCopy.objects.filter(branch_id=branch_id).values('book_id'))
+    return books
+
+
+def filter_by_genre(books, genre_id):
+    """Книги жанра и всех его поджанров - один запрос по префиксу пути"""
+    if _is_set(genre_id):
+        genre_path = Category.objects.filter(id=genre_id).values('path')[:1]
+        books = books.filter(
+            id__in=BookCategory.objects.filter(category__path__startswith=Subquery(genre_path)).values('book_id')
+        )
+    return books
+
+
+def _is_set(value):
+    return bool(value) and value != 'all'
+
+
+def _count_filter(relation, books):
+    # Без ограничений считаем по всему каталогу, не добавляя подзапрос
+    if books is None:
+        return None
+    return Q(**{f'{relation}__in': books.order_by().values('id')})
+
+
+def facet_counts(books=None, branch_id=None, genre_id=None):
+    """
+    Количество книг по каждому филиалу и жанру с учетом остальных фильтров.
+    books - книги после поиска (None - весь каталог); собственный фильтр
+    измерения к его счетчикам не применяется. Один запрос на измерение,
+    филиалы и жанры без книг возвращаются с нулем.
+    """
+    scoped = books if books is not None else Book.objects.all()
+    branch_scope = filter_by_genre(scoped, genre_id) if _is_set(genre_id) else books
+    genre_scope = filter_by_branch(scoped, branch_id) if _is_set(branch_id) else books
+
+    branches = Branch.objects.filter(is_active=True).annotate(
+        books_count=Count('bookcopy__book', filter=_count_filter('bookcopy__book', branch_scope), distinct=True)
+    ).values_list('id', 'books_count')
+
+    # Жанр считается вместе с поджанрами: коррелированный подзапрос по префиксу пути
+    subtree_links = BookCategory.objects.filter(category__path__startswith=OuterRef('path'))
+    if genre_scope is not None:
+        subtree_links = subtree_links.filter(book_id__in=genre_scope.order_by().values('id'))
+    subtree_count = subtree_links.order_by().annotate(
+        group=Value(1)
+    ).values('group').annotate(total=Count('book_id', distinct=True)).values('total')
+    genres = Category.objects.annotate(
+        books_count=Coalesce(Subquery(subtree_count), 0)
+    ).values_list('id', 'books_count')
+
+    return {
+        'branches': dict(branches),
+        'genres': dict(genres),
+    }
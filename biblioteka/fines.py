@@ -0,0 +1,148 @@
+# biblioteka/fines.py
+"""
+Пакетное начисление штрафов по просроченным и утерянным выдачам.
+
+Выдачи читаются порциями по первичному ключу одним запросом вместе с ценой
+книги, суммы считаются numpy по массивам сроков возврата и цен (в копейках).
+У выдачи не больше одного неоплаченного штрафа: он создается или его сумма
+обновляется, поэтому повторный запуск ничего не меняет. Штрафы с начатым
+платежом не пересчитываются. Списанный штраф (waived) означает, что выдачу
+больше не штрафуют; оплаченный закрывает выдачу для полного прохода.
+Отмененный платеж (cancelled) штраф не списывает: выдача штрафуется снова.
+
+Политика задается settings.FINE_POLICY поверх DEFAULT_POLICY.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BookLoan, Fine
+
+
+CHUNK_SIZE = 2000
+DEFAULT_POLICY = {
+    # Пеня за каждый полный день просрочки
+    'per_day': Decimal('10.00'),
+    # Потолок пени - доля цены книги
+    'overdue_cap': 1.0,
+    # Штраф за утерю - доля цены книги
+    'lost_share': 1.0,
+    # Цена книги, если она не указана
+    'default_price': Decimal('500.00'),
+}
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def get_policy():
+    return {**DEFAULT_POLICY, **getattr(settings, 'FINE_POLICY', {})}
+
+
+def _cents(value):
+    return int(Decimal(str(value or 0)) * 100)
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def compute_amounts(lost, due, prices, now, policy=None):
+    """
+    Векторный расчет по массивам одинаковой длины:
+    lost - признак утери, due - срок возврата (секунды epoch), prices - цена книги в копейках.
+    Возвращает (суммы штрафов в копейках, дней просрочки).
+    """
+    policy = policy or get_policy()
+    lost = np.asarray(lost, dtype=bool)
+    prices = np.asarray(prices, dtype=np.int64)
+    prices = np.where(prices > 0, prices, _cents(policy['default_price']))
+
+    days = np.maximum((int(now) - np.asarray(due, dtype=np.int64)) // SECONDS_PER_DAY, 0)
+    cap = np.floor(prices * float(policy['overdue_cap'])).astype(np.int64)
+    overdue = np.minimum(days * _cents(policy['per_day']), cap)
+    lost_amount = np.floor(prices * float(policy['lost_share'])).astype(np.int64)
+    return np.where(lost, lost_amount, overdue), days
+
+
+def _reason(is_lost, days, title):
+    if is_lost:
+        reason = f"Утеря книги: {title}"
+    else:
+        reason = f"Просрочка возврата ({days} дн.): {title}"
+    return reason[:200]
+
+
+def fineable_loans(now, loan_ids=None):
+    """Утерянные и невозвращенные после срока выдачи"""
+    loans = BookLoan.objects.filter(
+        Q(status='lost') | Q(status__in=['active', 'overdue'], return_date__isnull=True, due_date__lt=now)
+    )
+    # Списанный библиотекарем штраф освобождает выдачу от начислений
+    loans = loans.exclude(fine__status='waived')
+    if loan_ids is None:
+        return loans.exclude(fine__status='paid')
+    # Явно переданные выдачи пересчитываются и после оплаты (например, утеря после пени)
+    return loans.filter(pk__in=loan_ids)
+
+
+def assess_fines(loan_ids=None, now=None, chunk_size=CHUNK_SIZE, policy=None):
+    """
+    Начисляет штрафы всем подходящим выдачам (или только loan_ids).
+    Возвращает {'created': ..., 'updated': ...}.
+    """
+    now = now or timezone.now()
+    policy = policy or get_policy()
+    loans = fineable_loans(now, loan_ids).order_by('pk').values_list(
+        'pk', 'user_id', 'status', 'due_date', 'book_copy__book__price', 'book_copy__book__title'
+    )
+    result = {'created': 0, 'updated': 0}
+    last_id = 0
+    while True:
+        rows = list(loans.filter(pk__gt=last_id)[:chunk_size])
+        if not rows:
+            return result
+        last_id = rows[-1][0]
+
+        ids, user_ids, statuses, due_dates, prices, titles = zip(*rows)
+        lost = np.array([status == 'lost' for status in statuses], dtype=bool)
+        amounts, days = compute_amounts(
+            lost,
+            np.array([int(due.timestamp()) for due in due_dates], dtype=np.int64),
+            np.array([_cents(price) for price in prices], dtype=np.int64),
+            now.timestamp(),
+            policy,
+        )
+
+        with transaction.atomic():
+            existing = {
+                fine.loan_id: fine
+                for fine in Fine.objects.select_for_update().filter(loan_id__in=ids, status='unpaid')
+            }
+            to_create, to_update = [], []
+            for i, loan_id in enumerate(ids):
+                if amounts[i] <= 0:
+                    continue
+                amount = _money(amounts[i])
+                reason = _reason(lost[i], int(days[i]), titles[i])
+                fine = existing.get(loan_id)
+                if fine is None:
+                    to_create.append(Fine(
+                        user_id=user_ids[i], loan_id=loan_id, amount=amount, reason=reason, status='unpaid',
+                    ))
+                elif not fine.yookassa_payment_id and (fine.amount != amount or fine.reason != reason):
+                    # Сумма не меняется, пока по штрафу идет платеж
+                    fine.amount, fine.reason = amount, reason
+                    to_update.append(fine)
+            Fine.objects.bulk_create(to_create, batch_size=500)
+            Fine.objects.bulk_update(to_update, ['amount', 'reason'], batch_size=500)
+        result['created'] += len(to_create)
+        result['updated'] += len(to_update)
+
+
+def assess_loan(loan):
+    """Штраф одной выдачи (создает или пересчитывает); None, если начислять нечего"""
+    assess_fines(loan_ids=[loan.pk])
+    return Fine.objects.filter(loan=loan, status='unpaid').first()
@@ -0,0 +1,154 @@
+# biblioteka/inventory.py
+"""
+Учет экземпляров книг по филиалам (BookInventory).
+
+Для пары (книга, филиал) хранятся счетчики available и reserved. Бронь,
+отмена брони, выдача и возврат меняют их одним условным UPDATE строки
+(F-выражения с проверкой остатка в WHERE), поэтому параллельные брони не
+могут разобрать последний экземпляр дважды. Book.available_count меняется
+на ту же разницу, и чтение доступности не суммирует экземпляры.
+
+Счетчики пересчитываются из строк (rebuild) при изменении экземпляров и
+если условный UPDATE не сработал там, где расхождение не должно мешать
+пользователю (выдача и возврат в админке). Команда rebuild_inventory
+пересчитывает все пары.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+
+from . import book_summary, catalog_cache
+from .models import Book, BookBooking, BookCopy, BookInventory, BookLoan, BookQueue, Branch
+
+
+class InventoryError(Exception):
+    """Нет свободного экземпляра, текст показывается пользователю"""
+
+
+def _counters(book_id, branch_id):
+    return BookInventory.objects.filter(book_id=book_id, branch_id=branch_id)
+
+
+def _available_changed(book_id, delta):
+    Book.objects.filter(pk=book_id).update(available_count=Greatest(F('available_count') + delta, 0))
+    catalog_cache.bump(f'book:{book_id}')
+
+
+def reserve(book_id, branch_id=None):
+    """
+    Переводит экземпляр из available в reserved и возвращает филиал.
+    Без филиала берется филиал с наибольшим остатком; InventoryError, если свободных нет.
+    """
+    if branch_id is not None:
+        candidates = [branch_id]
+    else:
+        candidates = BookInventory.objects.filter(book_id=book_id, available__gt=0).order_by(
+            '-available', 'branch_id'
+        ).values_list('branch_id', flat=True)
+
+    with transaction.atomic():
+        for candidate in candidates:
+            # Остаток мог уйти к параллельной брони - тогда пробуем следующий филиал
+            if _counters(book_id, candidate).filter(available__gte=1).update(
+                available=F('available') - 1, reserved=F('reserved') + 1
+            ):
+                _available_changed(book_id, -1)
+                return candidate
+    raise InventoryError('Нет доступных экземпляров книги')
+
+
+def release(book_id, branch_id, count=1):
+    """Возвращает count забронированных экземпляров в available (отмена или истечение брони)"""
+    with transaction.atomic():
+        if _counters(book_id, branch_id).filter(reserved__gte=count).update(
+            available=F('available') + count, reserved=F('reserved') - count
+        ):
+            _available_changed(book_id, count)
+        else:
+            rebuild([(book_id, branch_id)])
+
+
+def take(book_id, branch_id):
+    """Экземпляр выдан читателю"""
+    with transaction.atomic():
+        if _counters(book_id, branch_id).filter(available__gte=1).update(available=F('available') - 1):
+            _available_changed(book_id, -1)
+        else:
+            # Выдачу в админке не блокируем, счетчики выравниваются по строкам
+            rebuild([(book_id, branch_id)])
+
+
+def put_back(book_id, branch_id):
+    """Экземпляр вернули в филиал"""
+    with transaction.atomic():
+        if _counters(book_id, branch_id).update(available=F('available') + 1):
+            _available_changed(book_id, 1)
+        else:
+            rebuild([(book_id, branch_id)])
+
+
+def rebuild(pairs=None):
+    """
+    Пересчитывает счетчики по активным экземплярам, активным броням, отложенным
+    для очереди экземплярам (book_queue.promote) и невозвращенным выдачам.
+    pairs - [(book_id, branch_id), ...], None - все пары. Возвращает количество пар.
+    """
+    copies = BookCopy.objects.filter(status='active')
+    # Просроченная, но еще не помеченная бронь держит экземпляр до expire_bookings,
+    # который вернет его в учет, поэтому pickup_deadline здесь не учитывается
+    bookings = BookBooking.objects.filter(status__in=['pending', 'ready'])
+    loans = BookLoan.objects.exclude(status='returned')
+    holds = BookQueue.objects.filter(status='notified', held_branch__isnull=False)
+    if pairs is not None:
+        pairs = set(pairs)
+        book_ids = {book_id for book_id, _ in pairs}
+        copies = copies.filter(book_id__in=book_ids)
+        bookings = bookings.filter(book_copy__book_id__in=book_ids)
+        loans = loans.filter(book_copy__book_id__in=book_ids)
+        holds = holds.filter(book_id__in=book_ids)
+
+    totals, reserved, on_loan = defaultdict(int), defaultdict(int), defaultdict(int)
+    rows = copies.values('book_id', 'branch_id').annotate(total=Sum('book_count'))
+    for row in rows.values_list('book_id', 'branch_id', 'total'):
+        totals[row[:2]] = row[2] or 0
+    rows = bookings.values('book_copy__book_id', 'branch_id').annotate(total=Count('pk'))
+    for row in rows.values_list('book_copy__book_id', 'branch_id', 'total'):
+        reserved[row[:2]] = row[2]
+    rows = holds.values('book_id', 'held_branch_id').annotate(total=Count('pk'))
+    for row in rows.values_list('book_id', 'held_branch_id', 'total'):
+        reserved[row[:2]] += row[2]
+    rows = loans.values('book_copy__book_id', 'book_copy__branch_id').annotate(total=Count('pk'))
+    for row in rows.values_list('book_copy__book_id', 'book_copy__branch_id', 'total'):
+        on_loan[row[:2]] = row[2]
+
+    if pairs is None:
+        keys = set(totals) | set(reserved) | set(BookInventory.objects.values_list('book_id', 'branch_id'))
+    else:
+        keys = pairs
+    # Пары удаленных книг и филиалов (сигналы удаления приходят после фиксации)
+    book_ids = set(Book.objects.filter(pk__in={book_id for book_id, _ in keys}).values_list('pk', flat=True))
+    branch_ids = set(Branch.objects.filter(pk__in={branch_id for _, branch_id in keys}).values_list('pk', flat=True))
+    keys = [key for key in keys if key[0] in book_ids and key[1] in branch_ids]
+
+    entries = []
+    for book_id, branch_id in keys:
+        key = (book_id, branch_id)
+        entries.append(BookInventory(
+            book_id=book_id,
+            branch_id=branch_id,
+            available=max(totals[key] - reserved[key] - on_loan[key], 0),
+            reserved=reserved[key],
+        ))
+    with transaction.atomic():
+        BookInventory.objects.bulk_create(
+            entries, batch_size=1000,
+            update_conflicts=True, unique_fields=['book', 'branch'], update_fields=['available', 'reserved'],
+        )
+        if pairs is None:
+            book_summary.refresh_available_count()
+        else:
+            book_summary.refresh_available_count(sorted(book_ids))
+            catalog_cache.bump(*(f'book:{book_id}' for book_id in sorted(book_ids)))
+    return len(entries)
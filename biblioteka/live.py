@@ -0,0 +1,191 @@
+# biblioteka/live.py
+"""
+Push-обновления свободных мест для страницы бронирования (SSE).
+
+Подписчики - asyncio-очереди async-представлений, сгруппированные по (филиал, дата).
+После фиксации изменений брони публикуются только слоты зала, которые она
+затрагивает. Публикация идет из потока в цикл подписчика через call_soon_threadsafe.
+
+Брокер живет в памяти процесса, а брони меняют все процессы: веб-воркеры
+(gunicorn с UvicornWorker, см. Procfile), процесс clock и админка. На PostgreSQL
+изменение рассылается через NOTIFY канала CHANNEL (room_changed), и в каждом
+процессе с подписчиками поток-слушатель (LISTEN на отдельном соединении)
+публикует его своим подписчикам. После переподключения слушателя подписчики
+получают reset, так как уведомления за время разрыва потеряны. На SQLite
+(разработка, один процесс) изменение публикуется сразу в памяти процесса.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+from collections import defaultdict
+from datetime import date, time as dt_time
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connection, connections
+
+from .models import ReadingRoom
+
+
+# Сколько событий может накопиться у медленного клиента до сброса
+QUEUE_SIZE = 100
+RESET = {'reset': True}
+
+CHANNEL = 'room_availability'
+# Как часто слушатель просыпается без уведомлений и пауза перед переподключением, секунды
+LISTEN_TIMEOUT = 5
+LISTEN_RETRY = 5
+
+
+def _offer(queue, message):
+    if queue.full():
+        # Клиент не успевает читать: события заменяются сигналом перезагрузить сетку
+        while not queue.empty():
+            queue.get_nowait()
+        message = RESET
+    queue.put_nowait(message)
+
+
+class AvailabilityBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, branch_id, day):
+        """Очередь событий для (филиал, дата); вызывается из async-кода"""
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[(branch_id, day)].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, branch_id, day, queue):
+        with self._lock:
+            subscribers = self._subscribers.get((branch_id, day))
+            if subscribers is None:
+                return
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                del self._subscribers[(branch_id, day)]
+
+    def watched(self, branch_id=None, day=None):
+        """Есть ли подписчики на дату (и филиал, если задан)"""
+        with self._lock:
+            return any(
+                key_day == day and (branch_id is None or key_branch == branch_id)
+                for key_branch, key_day in self._subscribers
+            )
+
+    def publish(self, branch_id, day, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get((branch_id, day), ()))
+        self._send(branch_id, day, subscribers, message)
+
+    def reset_all(self):
+        """Просит всех подписчиков процесса перезагрузить доступность"""
+        with self._lock:
+            groups = [(key, list(subscribers)) for key, subscribers in self._subscribers.items()]
+        for (branch_id, day), subscribers in groups:
+            self._send(branch_id, day, subscribers, RESET)
+
+    def _send(self, branch_id, day, subscribers, message):
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # Цикл подписчика уже закрыт
+                self.unsubscribe(branch_id, day, queue)
+
+
+broker = AvailabilityBroker()
+
+
+def publish_room_change(room_id, day, start_time=None, end_time=None):
+    """
+    Отправляет подписчикам филиала свободные места зала на дату.
+    Если задан интервал брони - только пересекающие его слоты.
+    """
+    if not broker.watched(day=day):
+        return
+    room = ReadingRoom.objects.filter(pk=room_id).first()
+    if room is None or not broker.watched(room.branch_id, day):
+        return
+
+    from .availability import rooms_availability
+    slots = rooms_availability([room], day)[0]['slots']
+    if start_time is not None and end_time is not None:
+        start, end = start_time.strftime("%H:%M"), end_time.strftime("%H:%M")
+        slots = [slot for slot in slots if slot['start'] < end and slot['end'] > start]
+    broker.publish(room.branch_id, day, {'room_id': room.id, 'slots': slots})
+
+
+def room_changed(room_id, day, start_time=None, end_time=None):
+    """
+    Сообщает об изменении броней зала подписчикам всех процессов.
+    Вызывается после фиксации транзакции (transaction.on_commit).
+    """
+    if connection.vendor != 'postgresql':
+        publish_room_change(room_id, day, start_time, end_time)
+        return
+    payload = json.dumps({
+        'room_id': room_id,
+        'date': day.isoformat(),
+        'start': start_time.isoformat() if start_time is not None else None,
+        'end': end_time.isoformat() if end_time is not None else None,
+    })
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+
+def _dispatch(payload):
+    data = json.loads(payload)
+    close_old_connections()
+    publish_room_change(
+        data['room_id'],
+        date.fromisoformat(data['date']),
+        dt_time.fromisoformat(data['start']) if data['start'] else None,
+        dt_time.fromisoformat(data['end']) if data['end'] else None,
+    )
+
+
+def _listen():
+    """Держит LISTEN на отдельном соединении и раздает уведомления брокеру процесса"""
+    reconnect = False
+    while True:
+        wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            if reconnect:
+                broker.reset_all()
+            reconnect = True
+            raw = wrapper.connection
+            while True:
+                if not select.select([raw], [], [], LISTEN_TIMEOUT)[0]:
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    notify = raw.notifies.pop(0)
+                    try:
+                        _dispatch(notify.payload)
+                    except Exception as e:
+                        print(f"Ошибка публикации доступности: {e}")
+        except Exception as e:
+            print(f"Слушатель {CHANNEL} переподключается: {e}")
+        finally:
+            wrapper.close()
+        time.sleep(LISTEN_RETRY)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """Запускает слушатель уведомлений в процессе при первой подписке (только PostgreSQL)"""
+    global _listener
+    if connection.vendor != 'postgresql' or _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name='live-listener', daemon=True)
+            _listener.start()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from biblioteka.fines import CHUNK_SIZE, assess_fines
+
+
+class Command(BaseCommand):
+    help = "Начисляет штрафы по просроченным и утерянным выдачам (ночной запуск)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help="Сколько выдач обрабатывать за один проход")
+        parser.add_argument('--loans', type=int, nargs='+',
+                            help="Пересчитать только эти выдачи")
+
+    def handle(self, *args, **options):
+        result = assess_fines(loan_ids=options['loans'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано штрафов: {result['created']}, обновлено: {result['updated']}"
+        ))
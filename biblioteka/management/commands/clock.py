@@ -0,0 +1,45 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# (команда, период в секундах, аргументы); при старте выполняются все
+JOBS = (
+    ('sweep_overdue', HOUR, {}),
+    ('assess_fines', DAY, {}),
+    # Страховка счетчиков остатков от правок мимо сигналов (UPDATE, raw SQL)
+    ('rebuild_inventory', DAY, {}),
+    # Книги, добавленные или выданные недавно, - с запасом на длительность прохода
+    ('rebuild_similar_books', HOUR, {'since_hours': 2}),
+    ('rebuild_similar_books', DAY, {}),
+)
+
+
+class Command(BaseCommand):
+    help = "Процесс clock: периодические пересчеты (просрочки, штрафы, остатки, похожие книги)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Выполнить все задачи один раз и выйти")
+
+    def handle(self, *args, **options):
+        next_run = [0.0] * len(JOBS)
+        while True:
+            for index, (name, period, job_options) in enumerate(JOBS):
+                if time.monotonic() < next_run[index]:
+                    continue
+                next_run[index] = time.monotonic() + period
+                close_old_connections()
+                try:
+                    call_command(name, stdout=self.stdout, stderr=self.stderr, **job_options)
+                except Exception as e:
+                    # Сбой одной задачи не останавливает остальные, повтор - в следующий период
+                    self.stderr.write(f"Ошибка задачи {name}: {e}")
+            if options['once']:
+                return
+            time.sleep(max(min(next_run) - time.monotonic(), 1))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from biblioteka.book_summary import refresh_authors_display, refresh_available_count
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные поля книг (авторы и доступные экземпляры)"
+
+    def handle(self, *args, **options):
+        authors = refresh_authors_display()
+        available = refresh_available_count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлено авторов: {authors}, остатков: {available}"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from biblioteka.inventory import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает остатки книг по филиалам по экземплярам, броням и выдачам"
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано пар книга/филиал: {count}"))
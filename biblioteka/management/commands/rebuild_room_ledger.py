@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from biblioteka.room_ledger import rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает учет мест в залах по броням, начиная с сегодняшнего дня"
+
+    def handle(self, *args, **options):
+        count = rebuild_ledger(timezone.localdate())
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано залов по датам: {count}"))
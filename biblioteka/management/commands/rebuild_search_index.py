@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from biblioteka.models import Book
+from biblioteka.search import reindex_books
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковые документы всех книг"
+
+    def handle(self, *args, **options):
+        reindex_books()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано книг: {Book.objects.count()}"))
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from biblioteka.models import Book
+from biblioteka.similarity import DEFAULT_TOP_K, rebuild_similar_books
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает индекс похожих книг (полностью или для измененных книг)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                            help="Сколько соседей хранить для каждой книги")
+        parser.add_argument('--books', type=int, nargs='+',
+                            help="Пересчитать только эти книги и связанные с ними")
+        parser.add_argument('--since-hours', type=int,
+                            help="Пересчитать книги, добавленные или выданные за последние N часов")
+
+    def handle(self, *args, **options):
+        book_ids = options['books']
+        if options['since_hours'] is not None:
+            since = timezone.now() - timedelta(hours=options['since_hours'])
+            changed = Book.objects.filter(
+                Q(created_at__gte=since) | Q(bookcopy__bookloan__issue_date__gte=since)
+            ).values_list('id', flat=True).distinct()
+            book_ids = sorted(set(book_ids or []) | set(changed))
+
+        updated = rebuild_similar_books(book_ids=book_ids, top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f"Обновлено книг: {updated}"))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from biblioteka.overdue import CHUNK_SIZE, sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Помечает просроченные выдачи, экземпляры, брони книг и отложенные для очереди экземпляры (для cron или процесса clock)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help="Сколько строк обновлять одним запросом")
+        parser.add_argument('--every', type=int,
+                            help="Повторять каждые N секунд вместо однократного запуска")
+
+    def handle(self, *args, **options):
+        while True:
+            loans, copies, bookings, holds = sweep_overdue(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Просрочено выдач: {loans}, экземпляров: {copies}, броней: {bookings}, "
+                f"отложенных экземпляров: {holds}"
+            ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:36
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс нужен только на PostgreSQL, на SQLite поиск идет по индексу в памяти
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS biblioteka_book_search_gin '
+        'ON biblioteka_book USING GIN (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS biblioteka_book_search_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0008_alter_bookcopy_book_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
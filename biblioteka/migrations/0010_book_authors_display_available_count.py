@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:39
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_book_summaries(apps, schema_editor):
+    Book = apps.get_model('biblioteka', 'Book')
+    BookAuthor = apps.get_model('biblioteka', 'BookAuthor')
+    BookCopy = apps.get_model('biblioteka', 'BookCopy')
+
+    active_copies = BookCopy.objects.filter(
+        book=OuterRef('pk'), status='active'
+    ).values('book').annotate(total=Sum('book_count')).values('total')
+    Book.objects.update(available_count=Coalesce(Subquery(active_copies), 0))
+
+    names = defaultdict(list)
+    for book_id, full_name in BookAuthor.objects.order_by('id').values_list('book_id', 'author__full_name'):
+        if full_name:
+            names[book_id].append(full_name)
+    books = [Book(id=book_id, authors_display=", ".join(authors)[:1000]) for book_id, authors in names.items()]
+    Book.objects.bulk_update(books, ['authors_display'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0009_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='authors_display',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000, verbose_name='Авторы'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='available_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Доступно экземпляров'),
+        ),
+        migrations.RunPython(fill_book_summaries, migrations.RunPython.noop),
+    ]
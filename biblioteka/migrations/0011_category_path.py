@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:43
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('biblioteka', 'Category')
+    children = {}
+    for category_id, parent_id in Category.objects.values_list('id', 'parent_id'):
+        children.setdefault(parent_id, []).append(category_id)
+
+    updated = []
+    queue = [(category_id, f"/{category_id}/", 0) for category_id in children.get(None, [])]
+    while queue:
+        category_id, path, depth = queue.pop()
+        updated.append(Category(id=category_id, path=path, depth=depth))
+        for child_id in children.get(category_id, []):
+            queue.append((child_id, f"{path}{child_id}/", depth + 1))
+    Category.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0010_book_authors_display_available_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='Путь'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
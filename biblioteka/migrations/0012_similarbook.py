@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0011_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarBook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='biblioteka.book', verbose_name='Книга')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='biblioteka.book', verbose_name='Похожая книга')),
+            ],
+            options={
+                'verbose_name': 'Похожая книга',
+                'verbose_name_plural': 'Похожие книги',
+                'unique_together': {('book', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0012_similarbook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomSlotLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('slot_start', models.TimeField(verbose_name='Начало слота')),
+                ('slot_end', models.TimeField(verbose_name='Конец слота')),
+                ('booked_seats', models.PositiveIntegerField(default=0, verbose_name='Занято мест')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='biblioteka.readingroom', verbose_name='Зал')),
+            ],
+            options={
+                'verbose_name': 'Загрузка слота',
+                'verbose_name_plural': 'Загрузка слотов',
+                'unique_together': {('room', 'date', 'slot_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0013_roomslotledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['status', 'return_date'], name='bookcopy_status_return_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['status', 'due_date'], name='bookloan_status_due_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0014_overdue_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookbooking',
+            index=models.Index(fields=['status', 'pickup_deadline'], name='bookbooking_status_pickup_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:30
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+SEQUENCE_GAP = 1024
+
+
+def spread_sequence(apps, schema_editor):
+    # Позиции нумеровались в каждой очереди (книга, филиал) отдельно: перенумеруем
+    # внутри группы по старому порядку, ключи с промежутками
+    BookQueue = apps.get_model('biblioteka', 'BookQueue')
+    ranks = defaultdict(int)
+    entries = []
+    for entry in BookQueue.objects.order_by('book_id', 'branch_id', 'sequence', 'id').only('book', 'branch'):
+        key = (entry.book_id, entry.branch_id)
+        ranks[key] += 1
+        entry.sequence = ranks[key] * SEQUENCE_GAP
+        entries.append(entry)
+    BookQueue.objects.bulk_update(entries, ['sequence'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0015_bookbooking_pickup_index'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='bookqueue',
+            old_name='position',
+            new_name='sequence',
+        ),
+        migrations.AlterField(
+            model_name='bookqueue',
+            name='sequence',
+            field=models.BigIntegerField(verbose_name='Ключ порядка в очереди'),
+        ),
+        migrations.RunPython(spread_sequence, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bookqueue',
+            index=models.Index(fields=['book', 'status', 'sequence'], name='bookqueue_book_status_seq_idx'),
+        ),
+    ]
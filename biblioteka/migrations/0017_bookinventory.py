@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:07
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_inventory(apps, schema_editor):
+    Book = apps.get_model('biblioteka', 'Book')
+    BookBooking = apps.get_model('biblioteka', 'BookBooking')
+    BookCopy = apps.get_model('biblioteka', 'BookCopy')
+    BookInventory = apps.get_model('biblioteka', 'BookInventory')
+    BookLoan = apps.get_model('biblioteka', 'BookLoan')
+
+    totals, reserved, on_loan = defaultdict(int), defaultdict(int), defaultdict(int)
+    rows = BookCopy.objects.filter(status='active').values('book_id', 'branch_id').annotate(total=Sum('book_count'))
+    for book_id, branch_id, total in rows.values_list('book_id', 'branch_id', 'total'):
+        totals[book_id, branch_id] = total or 0
+    # Как inventory.rebuild: просроченная, но не помеченная бронь держит экземпляр до expire_bookings
+    rows = BookBooking.objects.filter(
+        status__in=['pending', 'ready'],
+    ).values('book_copy__book_id', 'branch_id').annotate(total=Count('pk'))
+    for book_id, branch_id, total in rows.values_list('book_copy__book_id', 'branch_id', 'total'):
+        reserved[book_id, branch_id] = total
+    rows = BookLoan.objects.exclude(status='returned').values(
+        'book_copy__book_id', 'book_copy__branch_id'
+    ).annotate(total=Count('pk'))
+    for book_id, branch_id, total in rows.values_list('book_copy__book_id', 'book_copy__branch_id', 'total'):
+        on_loan[book_id, branch_id] = total
+
+    BookInventory.objects.bulk_create([
+        BookInventory(
+            book_id=book_id,
+            branch_id=branch_id,
+            available=max(totals[book_id, branch_id] - reserved[book_id, branch_id] - on_loan[book_id, branch_id], 0),
+            reserved=reserved[book_id, branch_id],
+        )
+        for book_id, branch_id in set(totals) | set(reserved)
+    ], batch_size=1000)
+
+    available = BookInventory.objects.filter(
+        book=OuterRef('pk')
+    ).values('book').annotate(total=Sum('available')).values('total')
+    Book.objects.update(available_count=Coalesce(Subquery(available), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0016_bookqueue_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('available', models.PositiveIntegerField(default=0, verbose_name='Доступно')),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='Забронировано')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='biblioteka.book', verbose_name='Книга')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='biblioteka.branch', verbose_name='Филиал')),
+            ],
+            options={
+                'verbose_name': 'Остаток книги в филиале',
+                'verbose_name_plural': 'Остатки книг в филиалах',
+                'unique_together': {('book', 'branch')},
+            },
+        ),
+        migrations.RunPython(fill_inventory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0017_bookinventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookqueue',
+            name='held_branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='biblioteka.branch', verbose_name='Филиал отложенного экземпляра'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0018_bookqueue_held_branch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fine',
+            name='status',
+            field=models.CharField(choices=[('unpaid', 'Не оплачен'), ('paid', 'Оплачен'), ('cancelled', 'Отменен'), ('waived', 'Списан')], default='unpaid', max_length=20, verbose_name='Статус'),
+        ),
+    ]
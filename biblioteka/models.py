@@ -1,6 +1,10 @@
 from datetime import timedelta
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Concat, Substr
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -24,6 +28,10 @@ class Branch(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        from .schedules import validate_opening_hours
+        validate_opening_hours(self.opening_hours)
+
 
 class Profile(models.Model):
     USER_TYPES = (
@@ -93,6 +101,9 @@ class Category(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, verbose_name="Родительская категория")
     description = models.TextField(blank=True, verbose_name="Описание")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Материализованный путь от корня: "/1/5/12/"; потомки - все пути с этим префиксом
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False, verbose_name="Путь")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень")
 
     class Meta:
         verbose_name = "Категория"
@@ -101,6 +112,80 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        super().clean()
+        if self.parent_id and self.pk and (self.parent_id == self.pk or self.parent_id in self._descendant_ids()):
+            raise ValidationError({'parent': "Категория не может быть вложена в себя или своего потомка"})
+
+    def save(self, *args, **kwargs):
+        # Путь берем из БД: экземпляр мог устареть после переноса предка
+        if self.pk:
+            stored = Category.objects.filter(pk=self.pk).values_list('path', 'depth').first()
+            if stored:
+                self.path, self.depth = stored
+        old_path, old_depth = self.path, self.depth
+
+        parent_path, parent_depth = '/', -1
+        if self.parent_id:
+            parent_path, parent_depth = Category.objects.values_list('path', 'depth').get(pk=self.parent_id)
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError("Категория не может быть вложена в себя или своего потомка")
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            new_path, new_depth = f"{parent_path}{self.pk}/", parent_depth + 1
+            if (new_path, new_depth) == (old_path, old_depth):
+                return
+
+            if old_path:
+                # Переносим все поддерево одним UPDATE
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=models.F('depth') + (new_depth - old_depth),
+                )
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        self.path, self.depth = new_path, new_depth
+
+    def get_path_ids(self):
+        """id категорий от корня до текущей"""
+        return [int(part) for part in self.path.strip('/').split('/') if part]
+
+    def get_descendants(self, include_self=True):
+        descendants = Category.objects.filter(path__startswith=self.path)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
+
+    def _descendant_ids(self):
+        if not self.path:
+            return []
+        return list(self.get_descendants(include_self=False).values_list('id', flat=True))
+
+
+def available_copies_expression():
+    """Сумма свободных экземпляров книги по филиалам (BookInventory) для аннотаций и UPDATE"""
+    # Коррелированный подзапрос не зависит от join'ов, добавленных другими фильтрами
+    available = BookInventory.objects.filter(
+        book=models.OuterRef('pk')
+    ).values('book').annotate(total=models.Sum('available')).values('total')
+    return Coalesce(models.Subquery(available), 0)
+
+
+class BookQuerySet(models.QuerySet):
+    def with_availability(self):
+        """Аннотирует available_copies - сумму свободных экземпляров по филиалам"""
+        return self.annotate(available_copies=available_copies_expression())
+
+    def availability_for(self, book_ids, branch_id=None):
+        """Возвращает {book_id: количество доступных экземпляров} по счетчикам (в филиале или всего)"""
+        book_ids = list(book_ids)
+        totals = dict.fromkeys(book_ids, 0)
+        rows = BookInventory.objects.filter(book_id__in=book_ids)
+        if branch_id is not None:
+            rows = rows.filter(branch_id=branch_id)
+        for book_id, available in rows.values_list('book_id', 'available'):
+            totals[book_id] += available
+        return totals
+
 
 class Book(models.Model):
     isbn = models.CharField(max_length=20, unique=True, blank=True, verbose_name="ISBN")
@@ -112,7 +197,16 @@ class Book(models.Model):
     pages = models.IntegerField(null=True, blank=True, verbose_name="Страниц")
     price = models.DecimalField(max_digits=10, decimal_places=2, default=500.00, verbose_name="Стоимость")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Поисковый документ для PostgreSQL, заполняется biblioteka.search.reindex_books
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Денормализованные поля для списков, поддерживаются сигналами (biblioteka.book_summary)
+    authors_display = models.CharField(max_length=1000, blank=True, default='', editable=False, verbose_name="Авторы")
+    available_count = models.IntegerField(default=0, editable=False, verbose_name="Доступно экземпляров")
 
+    objects = BookQuerySet.as_manager()
+
+    # Поля, которые пересчитываются сигналами и не должны затираться устаревшим экземпляром
+    DERIVED_FIELDS = ('search_vector', 'authors_display', 'available_count')
 
     class Meta:
         verbose_name = "Книга"
@@ -121,34 +215,46 @@ class Book(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_authors_display(self):
         """Возвращает строку с именами авторов"""
-        authors = self.bookauthor_set.select_related('author').all()
-        if not authors:
-            return "Не указан"
-
-        author_names = []
-        for book_author in authors:
-            name_parts = []
-            if book_author.author.full_name:
-                name_parts.append(book_author.author.full_name)
-            if name_parts:
-                author_names.append(" ".join(name_parts))
-
-        return ", ".join(author_names) if author_names else "Не указан"
+        return self.authors_display or "Не указан"
 
     def get_available_copies_count(self):
         """Возвращает общее количество доступных экземпляров"""
-        copies = self.bookcopy_set.filter(status='active')
-        total = 0
-        for copy in copies:
-            total += copy.book_count
-        return total
+        # Если книга получена через with_availability(), берем свежую аннотацию
+        if hasattr(self, 'available_copies'):
+            return self.available_copies
+        return self.available_count
 
     def is_available(self):
         """Проверяет, доступна ли книга"""
         return self.get_available_copies_count() > 0
 
+
+class SimilarBook(models.Model):
+    """Предрасчитанные соседи книги (biblioteka.similarity, команда rebuild_similar_books)"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_entries', verbose_name="Книга")
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_to', verbose_name="Похожая книга")
+    score = models.FloatField(verbose_name="Сходство")
+    rank = models.PositiveSmallIntegerField(verbose_name="Место")
+
+    class Meta:
+        verbose_name = "Похожая книга"
+        verbose_name_plural = "Похожие книги"
+        unique_together = ['book', 'rank']
+
+    def __str__(self):
+        return f"{self.book.title} → {self.similar.title} ({self.score:.3f})"
+
+
 class BookAuthor(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name="Книга")
     author = models.ForeignKey(Author, on_delete=models.CASCADE, verbose_name="Автор")
@@ -197,6 +303,10 @@ class BookCopy(models.Model):
     class Meta:
         verbose_name = "Экземпляр книги"
         verbose_name_plural = "Экземпляры книг"
+        indexes = [
+            # Поиск просроченных экземпляров (overdue.sweep_copies)
+            models.Index(fields=['status', 'return_date'], name='bookcopy_status_return_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.title} ({self.book_count})"
@@ -218,6 +328,20 @@ class BookCopy(models.Model):
         return self.status == 'active' and self.return_date and self.return_date < timezone.now().date()
 
 
+class BookBookingQuerySet(models.QuerySet):
+    def active(self, now=None):
+        """Брони pending/ready, срок получения которых не истек"""
+        now = now or timezone.now()
+        return self.filter(status__in=['pending', 'ready']).filter(
+            models.Q(pickup_deadline__isnull=True) | models.Q(pickup_deadline__gte=now)
+        )
+
+    def expired(self, now=None):
+        """Брони pending/ready с истекшим сроком получения"""
+        now = now or timezone.now()
+        return self.filter(status__in=['pending', 'ready'], pickup_deadline__lt=now)
+
+
 class BookBooking(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Обрабатывается'),
@@ -234,9 +358,16 @@ class BookBooking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     ready_by = models.DateTimeField(null=True, blank=True, verbose_name="Готов к")
     pickup_deadline = models.DateTimeField(null=True, blank=True, verbose_name="Забрать до")
+
+    objects = BookBookingQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Бронирование книги"
         verbose_name_plural = "Бронирования книг"
+        indexes = [
+            # Поиск брони с истекшим сроком получения (overdue.expire_bookings)
+            models.Index(fields=['status', 'pickup_deadline'], name='bookbooking_status_pickup_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book_copy.book.title}"
@@ -280,6 +411,10 @@ class BookLoan(models.Model):
     class Meta:
         verbose_name = "Выдача книги"
         verbose_name_plural = "Выдачи книг"
+        indexes = [
+            # Поиск просроченных выдач (overdue.sweep_loans)
+            models.Index(fields=['status', 'due_date'], name='bookloan_status_due_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book_copy.book.title}"
@@ -301,6 +436,46 @@ class BookLoan(models.Model):
         return dict(self.STATUS_CHOICES).get(self.status, 'Неизвестно')
 
 
+class BookInventory(models.Model):
+    """Счетчики экземпляров книги в филиале, ведутся biblioteka.inventory"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='inventory', verbose_name="Книга")
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, verbose_name="Филиал")
+    # Можно забронировать или выдать прямо сейчас
+    available = models.PositiveIntegerField(default=0, verbose_name="Доступно")
+    # Удерживаются бронями pending/ready и отложены для уведомленных из очереди (BookQueue.held_branch)
+    reserved = models.PositiveIntegerField(default=0, verbose_name="Забронировано")
+
+    class Meta:
+        verbose_name = "Остаток книги в филиале"
+        verbose_name_plural = "Остатки книг в филиалах"
+        unique_together = ['book', 'branch']
+
+    def __str__(self):
+        return f"{self.book.title} - {self.branch.name}: {self.available}"
+
+
+def occupied_seats_expression(date, start_time, end_time):
+    """Сумма мест подтвержденных броней зала, пересекающих интервал, для аннотаций"""
+    overlapping = RoomBooking.objects.filter(
+        room=models.OuterRef('pk'),
+        booking_date=date,
+        status='confirmed',
+        start_time__lt=end_time,
+        end_time__gt=start_time,
+    ).values('room').annotate(total=models.Sum('seats_count')).values('total')
+    return Coalesce(models.Subquery(overlapping), 0)
+
+
+class ReadingRoomQuerySet(models.QuerySet):
+    def with_occupied_seats(self, date, start_time, end_time):
+        """Аннотирует occupied_seats - места, занятые бронями в интервале"""
+        return self.annotate(occupied_seats=occupied_seats_expression(date, start_time, end_time))
+
+    def occupancy(self, date, start_time, end_time):
+        """Возвращает {room_id: занятые места} для залов выборки одним запросом"""
+        return dict(self.with_occupied_seats(date, start_time, end_time).values_list('id', 'occupied_seats'))
+
+
 class ReadingRoom(models.Model):
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, verbose_name="Филиал")
     name = models.CharField(max_length=100, verbose_name="Название")
@@ -313,6 +488,8 @@ class ReadingRoom(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ReadingRoomQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Читальный зал"
         verbose_name_plural = "Читальные залы"
@@ -321,19 +498,34 @@ class ReadingRoom(models.Model):
     def __str__(self):
         return f"{self.branch.name} - {self.name}"
 
+    def clean(self):
+        from .schedules import validate_opening_hours
+        validate_opening_hours(self.opening_hours)
+
     def get_occupied_seats(self, date, start_time, end_time):
-        from .models import RoomBooking
-        bookings = RoomBooking.objects.filter(
+        """Места, занятые бронями в интервале; сумма считается в базе"""
+        return RoomBooking.objects.filter(
             room=self,
             booking_date=date,
             status='confirmed',
             start_time__lt=end_time,
             end_time__gt=start_time
-        )
-        return sum(booking.seats_count for booking in bookings)
+        ).aggregate(total=Coalesce(models.Sum('seats_count'), 0))['total']
 
     def is_available(self, date, start_time, end_time, seats_needed=1):
-        occupied = self.get_occupied_seats(date, start_time, end_time)
+        from .availability import covered_slots
+        from .occupancy import occupancy_cache
+        from .schedules import slots_for
+
+        # Интервал по сетке слотов проверяется по кэшу занятости без запросов к броням
+        slots = slots_for(self.id, date)
+        covered = covered_slots(slots, start_time, end_time)
+        if covered and covered[0][0] == start_time and covered[-1][1] == end_time:
+            counts = occupancy_cache.occupied({self.id: slots}, date, {self.id: self.branch_id})[self.id]
+            first = slots.index(covered[0])
+            occupied = max(counts[first:first + len(covered)])
+        else:
+            occupied = self.get_occupied_seats(date, start_time, end_time)
         return self.available_seats - occupied >= seats_needed
 
 
@@ -363,11 +555,30 @@ class RoomBooking(models.Model):
         return f"{self.user.username} - {self.room.name} - {self.booking_date}"
 
 
+class RoomSlotLedger(models.Model):
+    """Занятые места зала по слотам дня, ведется biblioteka.room_ledger"""
+    room = models.ForeignKey(ReadingRoom, on_delete=models.CASCADE, verbose_name="Зал")
+    date = models.DateField(verbose_name="Дата")
+    slot_start = models.TimeField(verbose_name="Начало слота")
+    slot_end = models.TimeField(verbose_name="Конец слота")
+    booked_seats = models.PositiveIntegerField(default=0, verbose_name="Занято мест")
+
+    class Meta:
+        verbose_name = "Загрузка слота"
+        verbose_name_plural = "Загрузка слотов"
+        unique_together = ['room', 'date', 'slot_start']
+
+    def __str__(self):
+        return f"{self.room.name} - {self.date} {self.slot_start:%H:%M}: {self.booked_seats}"
+
+
 class Fine(models.Model):
     STATUS_CHOICES = (
         ('unpaid', 'Не оплачен'),
         ('paid', 'Оплачен'),
         ('cancelled', 'Отменен'),
+        # Штраф прощен библиотекарем: выдача больше не штрафуется (fines.fineable_loans)
+        ('waived', 'Списан'),
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
@@ -421,6 +632,21 @@ class BookReview(models.Model):
         return f"{self.user.username} - {self.book.title} - {self.rating}★"
 
 
+class BookQueueQuerySet(models.QuerySet):
+    def with_rank(self):
+        """
+        Аннотирует rank - место среди ожидающих книгу в том же филиале (1 - следующий).
+        Записи без филиала образуют свою очередь; branch сравнивается через Coalesce, иначе NULL = NULL ложно.
+        """
+        ahead = BookQueue.objects.annotate(branch_key=Coalesce('branch', 0)).filter(
+            book=models.OuterRef('book'),
+            branch_key=Coalesce(models.OuterRef('branch'), 0, output_field=models.IntegerField()),
+            status='waiting',
+            sequence__lt=models.OuterRef('sequence'),
+        ).values('book').annotate(total=models.Count('pk')).values('total')
+        return self.annotate(rank=Coalesce(models.Subquery(ahead), 0) + 1)
+
+
 class BookQueue(models.Model):
     STATUS_CHOICES = (
         ('waiting', 'В ожидании'),
@@ -432,15 +658,40 @@ class BookQueue(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name="Книга")
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Филиал")
-    position = models.IntegerField(verbose_name="Позиция в очереди")
+    # Разреженный ключ порядка (см. book_queue.SEQUENCE_GAP); место в очереди - rank из with_rank()
+    sequence = models.BigIntegerField(verbose_name="Ключ порядка в очереди")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting', verbose_name="Статус")
     created_at = models.DateTimeField(auto_now_add=True)
     notified_at = models.DateTimeField(null=True, blank=True, verbose_name="Время уведомления")
+    # Филиал, где за уведомленным отложен экземпляр (учтен в BookInventory.reserved)
+    held_branch = models.ForeignKey(
+        Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        verbose_name="Филиал отложенного экземпляра",
+    )
+
+    objects = BookQueueQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Очередь на книгу"
         verbose_name_plural = "Очереди на книги"
         unique_together = ['user', 'book', 'branch']
+        indexes = [
+            # Голова очереди и подсчет места (book_queue.promote, with_rank)
+            models.Index(fields=['book', 'status', 'sequence'], name='bookqueue_book_status_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.book.title} - {self.get_status_display()}"
+
+
+class CatalogVersion(models.Model):
+    """Версия области кэша каталога (biblioteka.catalog_cache), общая для всех процессов"""
+    name = models.CharField(max_length=255, unique=True, verbose_name="Область")
+    token = models.CharField(max_length=32, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Версия кэша каталога"
+        verbose_name_plural = "Версии кэша каталога"
 
     def __str__(self):
-        return f"{self.user.username} - {self.book.title} - Позиция {self.position}"
\ No newline at end of file
+        return f"{self.name}: {self.token}"
@@ -0,0 +1,138 @@
+# biblioteka/occupancy.py
+"""
+Кэш занятости залов в памяти процесса.
+
+Для пары (зал, дата) хранится массив занятых мест по слотам (array('i'))
+вместе с версией области room_bookings:branch:<филиал> (catalog_cache), при
+которой он загружен. При чтении версии сверяются одним запросом: бронь в любом
+процессе меняет версию, и запись перечитывается, поэтому ответ совпадает с ETag
+/api/availability/, построенным из тех же версий. Свои брони процесс дополнительно
+применяет к массиву после фиксации транзакции. Записи живут не дольше ENTRY_TTL,
+прошедшие даты вытесняются при смене дня.
+"""
+import threading
+import time
+from array import array
+from datetime import date
+
+from . import catalog_cache
+from .availability import covered_slots, occupied_by_slot
+from .models import RoomBooking
+
+
+# Срок жизни записи: ограничивает память под даты, к которым больше не обращаются
+ENTRY_TTL = 300
+
+
+def booking_scope(branch_id):
+    """Область версий броней филиала (та же, что в ETag /api/availability/)"""
+    return f'room_bookings:branch:{branch_id}'
+
+
+class OccupancyCache:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._today = None
+        # Счетчик изменений: загрузка, пересекшаяся с изменением, не кэшируется
+        self._changes = 0
+
+    def occupied(self, room_slots, booking_date, room_branches):
+        """
+        room_slots - {room_id: слоты зала на дату}, room_branches - {room_id: branch_id}.
+        Возвращает {room_id: [занято мест по слотам]}; отсутствующие и устаревшие
+        залы загружаются одним запросом.
+        """
+        room_slots = {room_id: tuple(slots) for room_id, slots in room_slots.items()}
+        scopes = {room_id: booking_scope(room_branches[room_id]) for room_id in room_slots}
+        tokens = dict(zip(scopes, catalog_cache.versions(scopes.values())))
+        result = {}
+        with self._lock:
+            self._evict_past()
+            for room_id, slots in room_slots.items():
+                counts = self._get(room_id, booking_date, slots, tokens[room_id])
+                if counts is not None:
+                    result[room_id] = list(counts)
+
+        missing = {room_id: slots for room_id, slots in room_slots.items() if room_id not in result}
+        if missing:
+            result.update(self._load(missing, booking_date, tokens))
+        return result
+
+    def apply(self, room_id, booking_date, start_time, end_time, seats):
+        """Добавляет (seats > 0) или снимает (seats < 0) места брони в закэшированной записи"""
+        with self._lock:
+            self._changes += 1
+            entry = self._entries.get((room_id, booking_date))
+            if entry is None:
+                return
+            _, slots, _, counts = entry
+            covered = covered_slots(list(slots), start_time, end_time)
+            if not covered:
+                return
+            first = slots.index(covered[0])
+            for i in range(first, first + len(covered)):
+                counts[i] = max(counts[i] + seats, 0)
+
+    def invalidate(self, room_id, booking_date):
+        with self._lock:
+            self._changes += 1
+            self._entries.pop((room_id, booking_date), None)
+
+    def invalidate_room(self, room_id):
+        """Сбрасывает все даты зала (бронь могли перенести на другой день)"""
+        with self._lock:
+            self._changes += 1
+            for key in [key for key in self._entries if key[0] == room_id]:
+                del self._entries[key]
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+
+    def _get(self, room_id, booking_date, slots, token):
+        entry = self._entries.get((room_id, booking_date))
+        if entry is None:
+            return None
+        expires_at, entry_slots, entry_token, counts = entry
+        if entry_slots != slots or entry_token != token or expires_at < time.monotonic():
+            del self._entries[(room_id, booking_date)]
+            return None
+        return counts
+
+    def _load(self, room_slots, booking_date, tokens):
+        # Версии прочитаны до броней: изменение между запросами даст новую версию,
+        # и запись перечитается при следующем обращении
+        with self._lock:
+            changes = self._changes
+        intervals = {room_id: [] for room_id in room_slots}
+        bookings = RoomBooking.objects.filter(
+            room_id__in=list(room_slots),
+            booking_date=booking_date,
+            status='confirmed',
+        ).values_list('room_id', 'start_time', 'end_time', 'seats_count')
+        for room_id, start, end, seats in bookings:
+            intervals[room_id].append((start, end, seats))
+
+        expires_at = time.monotonic() + ENTRY_TTL
+        result = {}
+        with self._lock:
+            store = changes == self._changes
+            for room_id, room_intervals in intervals.items():
+                slots = room_slots[room_id]
+                counts = array('i', occupied_by_slot(list(slots), room_intervals))
+                if store:
+                    self._entries[(room_id, booking_date)] = (expires_at, slots, tokens[room_id], counts)
+                result[room_id] = list(counts)
+        return result
+
+    def _evict_past(self):
+        today = date.today()
+        if today == self._today:
+            return
+        self._today = today
+        for key in [key for key in self._entries if key[1] < today]:
+            del self._entries[key]
+
+
+occupancy_cache = OccupancyCache()
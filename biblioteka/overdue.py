@@ -0,0 +1,101 @@
+# biblioteka/overdue.py
+"""
+Массовая пометка просроченных выдач, экземпляров и броней книг.
+
+BookLoan.save() и BookCopy.save() ставят статус overdue только при сохранении
+строки, поэтому статусы отстают, пока запись никто не трогает. Здесь просроченные
+строки переводятся в overdue UPDATE-запросами порциями по первичному ключу
+(индексы (status, due_date) и (status, return_date)), без загрузки моделей.
+UPDATE не вызывает сигналы, поэтому учет экземпляров и кэш каталога обновляются явно.
+Брони pending/ready с истекшим pickup_deadline так же переводятся в expired
+(индекс (status, pickup_deadline)), освободившиеся экземпляры уходят очереди;
+экземпляры, отложенные для очереди дольше book_queue.HOLD_DAYS, передаются следующему.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import book_queue, catalog_cache, inventory
+from .models import BookBooking, BookCopy, BookLoan
+
+
+CHUNK_SIZE = 5000
+
+
+def overdue_loans(now=None):
+    """Активные невозвращенные выдачи с прошедшим сроком"""
+    now = now or timezone.now()
+    return BookLoan.objects.filter(status='active', due_date__lt=now, return_date__isnull=True)
+
+
+def overdue_copies(today=None):
+    """Активные экземпляры с прошедшим сроком возврата"""
+    today = today or timezone.localdate()
+    return BookCopy.objects.filter(status='active', return_date__lt=today)
+
+
+def _sweep(queryset, chunk_size, status='overdue', on_chunk=None):
+    """
+    Переводит строки queryset в status порциями: id порции и UPDATE по ним
+    в отдельной транзакции. Обновленные строки выпадают из фильтра, поэтому
+    следующая порция берется с начала. Возвращает количество обновленных строк.
+
+    Строки порции блокируются при выборке, занятые другой транзакцией (отмена
+    брони, параллельный проход) пропускаются: on_chunk получает ровно те id,
+    которые переведены в status.
+    """
+    updated = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                queryset.select_for_update(skip_locked=True, of=('self',))
+                .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return updated
+            count = queryset.filter(pk__in=ids).update(status=status)
+            if on_chunk is not None:
+                on_chunk(ids)
+        updated += count
+
+
+def sweep_loans(now=None, chunk_size=CHUNK_SIZE):
+    return _sweep(overdue_loans(now), chunk_size)
+
+
+def _copies_changed(ids):
+    pairs = set(BookCopy.objects.filter(pk__in=ids).values_list('book_id', 'branch_id'))
+    # Просроченный экземпляр перестает считаться доступным
+    inventory.rebuild(pairs)
+    catalog_cache.bump('facets', *(f'branch:{branch_id}' for branch_id in sorted({pair[1] for pair in pairs})))
+
+
+def sweep_copies(today=None, chunk_size=CHUNK_SIZE):
+    return _sweep(overdue_copies(today), chunk_size, on_chunk=_copies_changed)
+
+
+def _bookings_expired(ids):
+    # Каждая истекшая бронь возвращает экземпляр в учет и освобождает его для следующего в очереди
+    released = Counter(BookBooking.objects.filter(pk__in=ids).values_list('book_copy__book_id', 'branch_id'))
+    for (book_id, branch_id), count in released.items():
+        inventory.release(book_id, branch_id, count)
+        book_queue.promote(book_id, branch_id)
+
+
+def expire_bookings(now=None, chunk_size=CHUNK_SIZE):
+    """
+    Переводит в expired брони, не полученные до pickup_deadline; зарезервированные
+    экземпляры возвращаются в учет филиала в той же транзакции.
+    """
+    return _sweep(BookBooking.objects.expired(now), chunk_size, status='expired', on_chunk=_bookings_expired)
+
+
+def sweep_overdue(now=None, chunk_size=CHUNK_SIZE):
+    """Точка входа для планировщика: возвращает (выдач, экземпляров, броней, отложенных) помечено"""
+    now = now or timezone.now()
+    loans = sweep_loans(now, chunk_size)
+    copies = sweep_copies(timezone.localdate(now), chunk_size)
+    bookings = expire_bookings(now, chunk_size)
+    holds = book_queue.expire_holds(now)
+    return loans, copies, bookings, holds
@@ -0,0 +1,72 @@
+# biblioteka/pagination.py
+import base64
+import json
+
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    """Размер страницы из параметра запроса, ограниченный MAX_PAGE_SIZE"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise InvalidCursor("Invalid limit")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _value(item, field):
+    return item[field] if isinstance(item, dict) else getattr(item, field)
+
+
+def keyset_paginate(queryset, ordering=('id',), cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Keyset-пагинация: вместо OFFSET фильтрует строки после последнего ключа.
+    ordering - уникальный в сумме ключ сортировки, например ('-search_rank', 'id').
+    Возвращает (элементы страницы, токен следующей страницы или None).
+    """
+    fields = [name.lstrip('-') for name in ordering]
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor, len(fields))
+        after = Q()
+        for i, name in enumerate(ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition = Q(**{f'{fields[i]}__{lookup}': values[i]})
+            for prev in range(i):
+                condition &= Q(**{fields[prev]: values[prev]})
+            after |= condition
+        queryset = queryset.filter(after)
+
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([_value(items[-1], field) for field in fields])
+    return items, next_cursor
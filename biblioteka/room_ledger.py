@@ -0,0 +1,261 @@
+# biblioteka/room_ledger.py
+"""
+Учет занятых мест в залах по слотам (RoomSlotLedger).
+
+Бронь списывает места во всех слотах интервала одним условным UPDATE:
+строка обновляется, только если в слоте хватает мест. Если обновились не все
+слоты, транзакция откатывается - параллельные брони не могут превысить
+вместимость, а проверка не сканирует брони зала за день.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from . import catalog_cache, live
+from .availability import covered_slots, occupied_by_slot
+from .models import RoomBooking, RoomSlotLedger
+from .occupancy import booking_scope, occupancy_cache
+from .schedules import room_schedules, slots_for
+
+
+# Наибольшее число броней в одном пакетном запросе
+MAX_BATCH_SIZE = 20
+
+
+class BookingError(Exception):
+    """Бронь невозможна, текст показывается пользователю"""
+
+
+def ensure_ledger(room_id, booking_date, slots=None):
+    """Создает недостающие строки учета на дату, заполняя их по существующим броням"""
+    if slots is None:
+        slots = slots_for(room_id, booking_date)
+    if not slots:
+        return
+    existing = set(RoomSlotLedger.objects.filter(room_id=room_id, date=booking_date).values_list('slot_start', flat=True))
+    missing = [slot for slot in slots if slot[0] not in existing]
+    if not missing:
+        return
+
+    intervals = RoomBooking.objects.filter(
+        room_id=room_id, booking_date=booking_date, status='confirmed'
+    ).values_list('start_time', 'end_time', 'seats_count')
+    occupied = dict(zip(slots, occupied_by_slot(slots, intervals)))
+    RoomSlotLedger.objects.bulk_create([
+        RoomSlotLedger(room_id=room_id, date=booking_date, slot_start=start, slot_end=end,
+                       booked_seats=occupied[(start, end)])
+        for start, end in missing
+    ], ignore_conflicts=True)
+
+
+def _covered(slots, room, start_time, end_time, seats):
+    """Слоты интервала; BookingError, если интервал или число мест недопустимы"""
+    covered = covered_slots(slots, start_time, end_time)
+    if start_time >= end_time or not covered:
+        raise BookingError('Интервал вне часов работы зала')
+    if seats < 1 or seats > room.total_seats:
+        raise BookingError('Недопустимое количество мест')
+    return covered
+
+
+def reserve(room, booking_date, start_time, end_time, seats):
+    """Списывает seats мест во всех слотах интервала или бросает BookingError"""
+    slots = slots_for(room.id, booking_date)
+    covered = _covered(slots, room, start_time, end_time, seats)
+
+    # Кэш занятости здесь не смотрим: он локален для процесса и может отставать,
+    # решает только условный UPDATE по учету в базе
+    with transaction.atomic():
+        ensure_ledger(room.id, booking_date, slots)
+        updated = RoomSlotLedger.objects.filter(
+            room=room,
+            date=booking_date,
+            slot_start__in=[start for start, _ in covered],
+            booked_seats__lte=room.total_seats - seats,
+        ).update(booked_seats=F('booked_seats') + seats)
+        if updated != len(covered):
+            raise BookingError('Недостаточно свободных мест в этом слоте')
+
+
+def release(booking):
+    """Возвращает места брони в учет (по пересечению, даже если расписание с тех пор менялось)"""
+    RoomSlotLedger.objects.filter(
+        room_id=booking.room_id,
+        date=booking.booking_date,
+        slot_start__lt=booking.end_time,
+        slot_end__gt=booking.start_time,
+    ).update(booked_seats=Greatest(F('booked_seats') - booking.seats_count, 0))
+
+
+def book_room(user, room, booking_date, start_time, end_time, seats=1):
+    """Проверяет пересечение с бронями пользователя, списывает места и создает бронь"""
+    with transaction.atomic():
+        user_conflict = RoomBooking.objects.filter(
+            user=user,
+            booking_date=booking_date,
+            status='confirmed',
+            start_time__lt=end_time,
+            end_time__gt=start_time
+        ).exists()
+        if user_conflict:
+            raise BookingError('У вас уже есть бронь в этот интервал')
+
+        reserve(room, booking_date, start_time, end_time, seats)
+        try:
+            with transaction.atomic():
+                return RoomBooking.objects.create(
+                    user=user,
+                    room=room,
+                    booking_date=booking_date,
+                    start_time=start_time,
+                    end_time=end_time,
+                    seats_count=seats,
+                    status='confirmed'
+                )
+        except IntegrityError:
+            # Бронь на точно такой же интервал зала уже есть (unique_together)
+            raise BookingError('Этот интервал уже забронирован')
+
+
+def book_rooms(user, items, partial=False):
+    """
+    Пакет броней одной транзакцией.
+    items - [(room, date, start_time, end_time, seats), ...]. Строки учета всех
+    затронутых залов и дат блокируются одним запросом, пакет проверяется по
+    снимку в памяти (вместимость, брони пользователя, пересечения внутри пакета),
+    затем учет и брони записываются bulk-операциями.
+    partial=False - все или ничего, True - создаются только прошедшие проверку.
+    Возвращает (созданные брони {индекс: RoomBooking}, ошибки {индекс: текст}).
+    """
+    pairs = {(room.id, booking_date) for room, booking_date, _, _, _ in items}
+    dates = {booking_date for _, booking_date in pairs}
+    schedules = room_schedules(room_id for room_id, _ in pairs)
+    slots = {(room_id, booking_date): list(schedules[room_id].slots_for(booking_date))
+             for room_id, booking_date in pairs}
+
+    with transaction.atomic():
+        for (room_id, booking_date), pair_slots in slots.items():
+            ensure_ledger(room_id, booking_date, pair_slots)
+
+        pair_filter = Q()
+        for room_id, booking_date in pairs:
+            pair_filter |= Q(room_id=room_id, date=booking_date)
+        ledger = {
+            (row.room_id, row.date, row.slot_start): row
+            for row in RoomSlotLedger.objects.select_for_update().filter(pair_filter)
+        }
+
+        booked_intervals = set(RoomBooking.objects.filter(
+            room_id__in={room_id for room_id, _ in pairs}, booking_date__in=dates
+        ).values_list('room_id', 'booking_date', 'start_time', 'end_time'))
+        user_intervals = defaultdict(list)
+        for booking_date, start, end in RoomBooking.objects.filter(
+            user=user, booking_date__in=dates, status='confirmed'
+        ).values_list('booking_date', 'start_time', 'end_time'):
+            user_intervals[booking_date].append((start, end))
+
+        accepted, errors, changed = [], {}, {}
+        for index, (room, booking_date, start_time, end_time, seats) in enumerate(items):
+            try:
+                covered = _covered(slots[(room.id, booking_date)], room, start_time, end_time, seats)
+                if any(start < end_time and end > start_time for start, end in user_intervals[booking_date]):
+                    raise BookingError('У вас уже есть бронь в этот интервал')
+                if (room.id, booking_date, start_time, end_time) in booked_intervals:
+                    raise BookingError('Этот интервал уже забронирован')
+                rows = [ledger[(room.id, booking_date, start)] for start, _ in covered]
+                if any(row.booked_seats + seats > room.total_seats for row in rows):
+                    raise BookingError('Недостаточно свободных мест в этом слоте')
+            except BookingError as e:
+                errors[index] = str(e)
+                continue
+
+            for row in rows:
+                row.booked_seats += seats
+                changed[row.pk] = row
+            user_intervals[booking_date].append((start_time, end_time))
+            booked_intervals.add((room.id, booking_date, start_time, end_time))
+            accepted.append(index)
+
+        if (errors and not partial) or not accepted:
+            return {}, errors
+
+        RoomSlotLedger.objects.bulk_update(changed.values(), ['booked_seats'])
+        try:
+            with transaction.atomic():
+                bookings = RoomBooking.objects.bulk_create([
+                    RoomBooking(
+                        user=user,
+                        room=items[index][0],
+                        booking_date=items[index][1],
+                        start_time=items[index][2],
+                        end_time=items[index][3],
+                        seats_count=items[index][4],
+                        status='confirmed',
+                    )
+                    for index in accepted
+                ])
+        except IntegrityError:
+            # Тот же интервал забронировали параллельно (мимо учета, например в админке)
+            # после чтения booked_intervals: пакет и списание мест откатываются
+            transaction.set_rollback(True)
+            errors.update({index: 'Интервал уже забронирован, повторите запрос' for index in accepted})
+            return {}, errors
+        # bulk_create не отправляет post_save - версии броней и кэш занятости обновляем сами
+        catalog_cache.bump(*{booking_scope(items[index][0].branch_id) for index in accepted})
+        def update_occupancy():
+            for booking in bookings:
+                occupancy_cache.apply(booking.room_id, booking.booking_date, booking.start_time,
+                                      booking.end_time, booking.seats_count)
+                live.room_changed(booking.room_id, booking.booking_date,
+                                  booking.start_time, booking.end_time)
+        transaction.on_commit(update_occupancy)
+
+    return dict(zip(accepted, bookings)), errors
+
+
+def cancel_booking(booking_id, user):
+    """Удаляет бронь пользователя и освобождает ее места"""
+    with transaction.atomic():
+        booking = RoomBooking.objects.select_for_update().get(id=booking_id, user=user)
+        if booking.status == 'confirmed':
+            release(booking)
+        booking.delete()
+
+
+def reconcile(room_id, booking_date):
+    """
+    Выравнивает существующие строки учета зала на дату по подтвержденным броням.
+    Нужен для правок мимо book_room/cancel_booking (админка, save(), delete()).
+    """
+    with transaction.atomic():
+        # Строки блокируются до чтения броней: места параллельной брони (reserve
+        # держит блокировку строки до фиксации) будут видны и не потеряются
+        rows = list(RoomSlotLedger.objects.select_for_update().filter(
+            room_id=room_id, date=booking_date
+        ).order_by('slot_start'))
+        if not rows:
+            return
+        intervals = RoomBooking.objects.filter(
+            room_id=room_id, booking_date=booking_date, status='confirmed'
+        ).values_list('start_time', 'end_time', 'seats_count')
+        occupied = occupied_by_slot([(row.slot_start, row.slot_end) for row in rows], intervals)
+        changed = []
+        for row, seats in zip(rows, occupied):
+            if row.booked_seats != seats:
+                row.booked_seats = seats
+                changed.append(row)
+        RoomSlotLedger.objects.bulk_update(changed, ['booked_seats'])
+
+
+def rebuild_ledger(since):
+    """Пересчитывает учет с даты since по броням (после ручных правок в админке)"""
+    with transaction.atomic():
+        RoomSlotLedger.objects.filter(date__gte=since).delete()
+        pairs = list(RoomBooking.objects.filter(
+            booking_date__gte=since, status='confirmed'
+        ).values_list('room_id', 'booking_date').distinct())
+        for room_id, booking_date in pairs:
+            ensure_ledger(room_id, booking_date)
+    return len(pairs)
@@ -0,0 +1,205 @@
+# biblioteka/schedules.py
+"""
+Расписание залов из JSON opening_hours.
+
+Формат (ReadingRoom.opening_hours и Branch.opening_hours):
+    {
+        "slot_minutes": 30,                         # длина слота: 15, 30 или 60
+        "default": ["08:00", "17:00"],              # часы дней без своего правила
+        "mon": ["09:00", "20:00"], "sun": null,     # mon..sun, null - выходной
+        "exceptions": {"2026-12-31": ["10:00", "15:00"], "2027-01-01": null}
+    }
+Порядок для дня: исключение зала, исключение филиала, день недели зала, default
+зала, день недели филиала, default филиала, 08:00-17:00 с шагом 60 минут.
+
+JSON разбирается один раз в Schedule, расписания кэшируются в памяти процесса
+по id зала вместе с версией области schedule:room:<id> (catalog_cache). Сигналы
+меняют версию при изменении зала или филиала, а чтение сверяет версии одним
+запросом, поэтому правка в любом процессе сбрасывает расписание во всех.
+Сетки слотов кэшируются по (открытие, закрытие, шаг).
+"""
+import threading
+from datetime import datetime, time
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+
+from . import catalog_cache
+from .availability import DEFAULT_END_HOUR, DEFAULT_START_HOUR
+from .models import ReadingRoom
+
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+SLOT_MINUTES = (15, 30, 60)
+DEFAULT_SLOT_MINUTES = 60
+DEFAULT_HOURS = (DEFAULT_START_HOUR * 60, DEFAULT_END_HOUR * 60)
+
+# Признак отсутствующего правила (None означает выходной)
+_MISSING = object()
+
+
+def _minutes(text):
+    value = datetime.strptime(text, "%H:%M")
+    return value.hour * 60 + value.minute
+
+
+def parse_hours(value):
+    """["09:00", "18:00"] -> (540, 1080); null или [] - выходной (None)"""
+    if value is None or value == []:
+        return None
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("Часы задаются как [\"ЧЧ:ММ\", \"ЧЧ:ММ\"]")
+    opens, closes = _minutes(value[0]), _minutes(value[1])
+    if opens >= closes:
+        raise ValueError("Время открытия должно быть раньше закрытия")
+    return opens, closes
+
+
+def _parse_source(data, strict=False):
+    """(slot_minutes, {день недели: часы}, default, {дата: часы}); ошибки пропускаются, если не strict"""
+    def parse(value):
+        try:
+            return parse_hours(value)
+        except (TypeError, ValueError):
+            if strict:
+                raise
+            return _MISSING
+
+    if not isinstance(data, dict):
+        if strict:
+            raise ValueError("Ожидается JSON-объект")
+        data = {}
+
+    slot_minutes = data.get('slot_minutes', _MISSING)
+    if slot_minutes is not _MISSING and slot_minutes not in SLOT_MINUTES:
+        if strict:
+            raise ValueError("slot_minutes: допустимо 15, 30 или 60")
+        slot_minutes = _MISSING
+
+    weekly = {day: parse(data[day]) for day in WEEKDAYS if day in data}
+    default = parse(data['default']) if 'default' in data else _MISSING
+
+    exceptions = {}
+    raw_exceptions = data.get('exceptions') or {}
+    if not isinstance(raw_exceptions, dict):
+        if strict:
+            raise ValueError("exceptions: ожидается объект {дата: часы}")
+        raw_exceptions = {}
+    for day, value in raw_exceptions.items():
+        try:
+            day = datetime.strptime(day, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            if strict:
+                raise ValueError(f"exceptions: неверная дата {day!r}")
+            continue
+        exceptions[day] = parse(value)
+    return slot_minutes, weekly, default, exceptions
+
+
+def validate_opening_hours(value):
+    """Проверка JSON при сохранении через формы (Model.clean)"""
+    try:
+        _parse_source(value, strict=True)
+    except (TypeError, ValueError) as e:
+        raise ValidationError({'opening_hours': str(e)})
+
+
+@lru_cache(maxsize=256)
+def _grid(opens, closes, step):
+    slots = []
+    current = opens
+    while current + step <= closes:
+        end = current + step
+        slots.append((time(current // 60, current % 60), time(end // 60, end % 60)))
+        current = end
+    return tuple(slots)
+
+
+class Schedule:
+    """Скомпилированное расписание: часы по дням недели и исключения в минутах"""
+    __slots__ = ('slot_minutes', 'weekly', 'exceptions')
+
+    def __init__(self, slot_minutes, weekly, exceptions):
+        self.slot_minutes = slot_minutes
+        self.weekly = weekly
+        self.exceptions = exceptions
+
+    def hours_for(self, day):
+        """(открытие, закрытие) в минутах или None, если зал закрыт"""
+        return self.exceptions.get(day, self.weekly[day.weekday()])
+
+    def slots_for(self, day):
+        hours = self.hours_for(day)
+        if hours is None:
+            return ()
+        return _grid(hours[0], hours[1], self.slot_minutes)
+
+
+def compile_schedule(room_hours, branch_hours):
+    room_step, room_weekly, room_default, room_exceptions = _parse_source(room_hours)
+    branch_step, branch_weekly, branch_default, branch_exceptions = _parse_source(branch_hours)
+
+    slot_minutes = next(
+        (step for step in (room_step, branch_step) if step is not _MISSING), DEFAULT_SLOT_MINUTES
+    )
+    weekly = []
+    for day in WEEKDAYS:
+        candidates = (room_weekly.get(day, _MISSING), room_default,
+                      branch_weekly.get(day, _MISSING), branch_default)
+        weekly.append(next((hours for hours in candidates if hours is not _MISSING), DEFAULT_HOURS))
+
+    exceptions = {day: hours for day, hours in branch_exceptions.items() if hours is not _MISSING}
+    exceptions.update({day: hours for day, hours in room_exceptions.items() if hours is not _MISSING})
+    return Schedule(slot_minutes, tuple(weekly), exceptions)
+
+
+_lock = threading.Lock()
+# {room_id: (версия, Schedule)}
+_schedules = {}
+
+
+def schedule_scope(room_id):
+    """Область версий расписания зала"""
+    return f'schedule:room:{room_id}'
+
+
+def room_schedules(room_ids):
+    """{room_id: Schedule}; отсутствующие и устаревшие расписания собираются одним запросом"""
+    room_ids = list(set(room_ids))
+    tokens = dict(zip(room_ids, catalog_cache.versions(schedule_scope(room_id) for room_id in room_ids)))
+    result = {}
+    with _lock:
+        for room_id in room_ids:
+            entry = _schedules.get(room_id)
+            if entry is not None and entry[0] == tokens[room_id]:
+                result[room_id] = entry[1]
+    missing = set(room_ids) - result.keys()
+    if missing:
+        # Версии прочитаны до JSON: правка между запросами даст новую версию и перекомпиляцию
+        rows = ReadingRoom.objects.filter(id__in=missing).values_list(
+            'id', 'opening_hours', 'branch__opening_hours'
+        )
+        compiled = {room_id: compile_schedule(room_hours, branch_hours) for room_id, room_hours, branch_hours in rows}
+        with _lock:
+            _schedules.update({room_id: (tokens[room_id], schedule) for room_id, schedule in compiled.items()})
+        result.update(compiled)
+    return result
+
+
+def room_schedule(room_id):
+    return room_schedules([room_id]).get(room_id) or compile_schedule({}, {})
+
+
+def slots_for(room_id, day):
+    """Слоты зала на дату [(start, end), ...]; пусто, если зал закрыт"""
+    return list(room_schedule(room_id).slots_for(day))
+
+
+def invalidate(room_ids=None):
+    """Сбрасывает расписания залов в этом процессе (все, если room_ids не заданы)"""
+    with _lock:
+        if room_ids is None:
+            _schedules.clear()
+        else:
+            for room_id in room_ids:
+                _schedules.pop(room_id, None)
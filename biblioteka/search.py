@@ -0,0 +1,290 @@
+# biblioteka/search.py
+"""
+Полнотекстовый поиск по каталогу.
+
+На PostgreSQL используется колонка Book.search_vector (tsvector с GIN-индексом),
+собранная из названия, авторов, категорий и описания с весами A/B/C/D.
+На остальных БД (SQLite в разработке и тестах) поиск идет по инвертированному
+индексу в памяти процесса с теми же весами и стеммингом русских слов.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+
+from .models import Book, BookAuthor, BookCategory
+
+
+SEARCH_CONFIG = 'russian'
+
+# Веса полей, как в ts_rank по умолчанию для A/B/C/D
+FIELD_WEIGHTS = {
+    'A': 1.0,  # название
+    'B': 0.4,  # авторы
+    'C': 0.2,  # категории
+    'D': 0.1,  # описание
+}
+
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то',
+    'все', 'она', 'так', 'его', 'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за',
+    'бы', 'по', 'ее', 'мне', 'было', 'вот', 'от', 'меня', 'о', 'из', 'ему',
+    'они', 'мы', 'их', 'ли', 'если', 'или', 'ни', 'для', 'это', 'при', 'до',
+}
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+# --- Стемминг (Snowball-алгоритм для русского языка) ---
+
+_RVRE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_I = re.compile(r'и$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя]+[^аеиоуыэюя]+[аеиоуыэюя]+.*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def stem(word):
+    """Возвращает основу русского слова; остальные слова не изменяются"""
+    word = word.lower().replace('ё', 'е')
+    match = _RVRE.match(word)
+    if not match:
+        return word
+    pre, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+
+    temp = _SOFT_SIGN.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = _NN.sub('н', rv, 1)
+    else:
+        rv = temp
+
+    return pre + rv
+
+
+def tokenize(text):
+    """Разбивает текст на нормализованные основы без стоп-слов"""
+    terms = []
+    for word in _WORD_RE.findall((text or '').lower()):
+        if word in STOP_WORDS:
+            continue
+        terms.append(stem(word))
+    return terms
+
+
+# --- Источник документов ---
+
+def load_documents(book_ids=None):
+    """
+    Поля поискового документа для книг: {book_id: {'A': ..., 'B': ..., 'C': ..., 'D': ...}}.
+    Три запроса на любое количество книг.
+    """
+    books = Book.objects.all()
+    links_filter = {}
+    if book_ids is not None:
+        books = books.filter(id__in=book_ids)
+        links_filter = {'book_id__in': book_ids}
+
+    documents = {
+        book_id: {'A': title, 'B': [], 'C': [], 'D': description}
+        for book_id, title, description in books.values_list('id', 'title', 'description')
+    }
+
+    for book_id, name in BookAuthor.objects.filter(**links_filter).values_list('book_id', 'author__full_name'):
+        if book_id in documents and name:
+            documents[book_id]['B'].append(name)
+
+    for book_id, name in BookCategory.objects.filter(**links_filter).values_list('book_id', 'category__name'):
+        if book_id in documents and name:
+            documents[book_id]['C'].append(name)
+
+    for fields in documents.values():
+        fields['B'] = ' '.join(fields['B'])
+        fields['C'] = ' '.join(fields['C'])
+    return documents
+
+
+# --- Инвертированный индекс в памяти ---
+
+class InvertedIndex:
+    """Индекс term -> {book_id: вес} для БД без полнотекстового поиска"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self.is_built = False
+
+    def build(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._doc_terms = {}
+            for book_id, fields in load_documents().items():
+                self._add(book_id, fields)
+            self.is_built = True
+
+    def update(self, book_ids):
+        """Переиндексирует книги; если индекс еще не построен, ничего не делает"""
+        with self._lock:
+            if not self.is_built:
+                return
+            documents = load_documents(book_ids)
+            for book_id in book_ids:
+                self._remove(book_id)
+                if book_id in documents:
+                    self._add(book_id, documents[book_id])
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def reset(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._doc_terms = {}
+            self.is_built = False
+
+    def search(self, query):
+        """Возвращает {book_id: score} для книг, содержащих все термы запроса"""
+        terms = set(tokenize(query))
+        if not terms:
+            return {}
+
+        with self._lock:
+            if not self.is_built:
+                self.build()
+
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return {}
+
+            total = len(self._doc_terms) or 1
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+
+            scores = {}
+            for posting in postings:
+                idf = math.log(1 + total / len(posting))
+                for book_id in candidates:
+                    scores[book_id] = scores.get(book_id, 0.0) + posting[book_id] * idf
+            return scores
+
+    def _add(self, book_id, fields):
+        terms = set()
+        for weight_class, text in fields.items():
+            weight = FIELD_WEIGHTS[weight_class]
+            for term in tokenize(text):
+                posting = self._postings[term]
+                posting[book_id] = posting.get(book_id, 0.0) + weight
+                terms.add(term)
+        self._doc_terms[book_id] = terms
+
+    def _remove(self, book_id):
+        for term in self._doc_terms.pop(book_id, ()):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(book_id, None)
+            if not posting:
+                del self._postings[term]
+
+
+memory_index = InvertedIndex()
+
+
+# --- Публичный API ---
+
+def reindex_books(book_ids=None):
+    """
+    Обновляет поисковые документы книг (все книги, если book_ids не передан).
+    На PostgreSQL пересчитывает Book.search_vector, иначе - индекс в памяти.
+    """
+    if not uses_postgres():
+        if book_ids is None:
+            memory_index.build()
+        else:
+            memory_index.update(list(book_ids))
+        return
+
+    from django.contrib.postgres.search import SearchVector
+
+    documents = load_documents(book_ids)
+    with transaction.atomic():
+        for book_id, fields in documents.items():
+            vector = (
+                SearchVector(Value(fields['A']), weight='A', config=SEARCH_CONFIG)
+                + SearchVector(Value(fields['B']), weight='B', config=SEARCH_CONFIG)
+                + SearchVector(Value(fields['C']), weight='C', config=SEARCH_CONFIG)
+                + SearchVector(Value(fields['D']), weight='D', config=SEARCH_CONFIG)
+            )
+            Book.objects.filter(id=book_id).update(search_vector=vector)
+
+
+def forget_book(book_id):
+    """Удаляет книгу из индекса в памяти (в PostgreSQL вектор удаляется вместе со строкой)"""
+    if not uses_postgres():
+        memory_index.remove(book_id)
+
+
+def search_books(queryset, query):
+    """
+    Фильтрует queryset книг по запросу и сортирует по релевантности.
+    Добавляет аннотацию search_rank.
+    """
+    if uses_postgres():
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', 'id')
+
+    scores = memory_index.search(query)
+    if not scores:
+        # Аннотация нужна и пустому результату: по ней сортирует пагинация
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+    return queryset.filter(id__in=scores.keys()).annotate(
+        search_rank=Case(
+            *[When(id=book_id, then=Value(score)) for book_id, score in scores.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    ).order_by('-search_rank', 'id')
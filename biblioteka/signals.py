@@ -0,0 +1,378 @@
+# biblioteka/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import book_queue, book_summary, catalog_cache, inventory, live, room_ledger, schedules, search, suggest
+from .occupancy import booking_scope, occupancy_cache
+from .models import (
+    Author, Book, BookAuthor, BookBooking, BookCategory, BookCopy, BookLoan, BookQueue, Branch, Category,
+    ReadingRoom, RoomBooking, RoomSlotLedger,
+)
+
+
+def _reindex_on_commit(book_ids):
+    """Переиндексация после фиксации транзакции, чтобы видеть итоговые данные"""
+    book_ids = list(book_ids)
+    if book_ids:
+        transaction.on_commit(lambda: search.reindex_books(book_ids))
+
+
+# --- Поисковый индекс ---
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    _reindex_on_commit([instance.id])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    search.forget_book(instance.id)
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+@receiver(post_save, sender=BookCategory)
+@receiver(post_delete, sender=BookCategory)
+def book_link_changed(sender, instance, **kwargs):
+    _reindex_on_commit([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, **kwargs):
+    if not created:
+        _reindex_on_commit(
+            BookAuthor.objects.filter(author=instance).values_list('book_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        _reindex_on_commit(
+            BookCategory.objects.filter(category=instance).values_list('book_id', flat=True)
+        )
+
+
+# --- Денормализованные поля книги ---
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+def book_author_changed(sender, instance, **kwargs):
+    book_summary.refresh_authors_display([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def author_renamed(sender, instance, created, **kwargs):
+    if not created:
+        book_summary.refresh_authors_display(
+            list(BookAuthor.objects.filter(author=instance).values_list('book_id', flat=True))
+        )
+
+
+@receiver(post_save, sender=BookCopy)
+@receiver(post_delete, sender=BookCopy)
+def book_copy_changed(sender, instance, **kwargs):
+    # Счетчики филиала пересчитываются по строкам (вместе с Book.available_count),
+    # появившийся свободный экземпляр откладывается для очереди
+    pair = (instance.book_id, instance.branch_id)
+    transaction.on_commit(lambda: (inventory.rebuild([pair]), book_queue.promote(*pair)))
+
+
+# --- Кэш каталога ---
+
+@receiver(post_save, sender=Book)
+def book_saved_cache(sender, instance, created, **kwargs):
+    scopes = [f'book:{instance.id}', 'search']
+    if created:
+        scopes += ['all', 'facets']
+    catalog_cache.bump(*scopes)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_cache(sender, instance, **kwargs):
+    catalog_cache.bump(f'book:{instance.id}', 'facets')
+
+
+@receiver(post_save, sender=BookCopy)
+@receiver(post_delete, sender=BookCopy)
+def book_copy_changed_cache(sender, instance, **kwargs):
+    catalog_cache.bump(f'book:{instance.book_id}', f'branch:{instance.branch_id}', 'facets')
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+def book_author_changed_cache(sender, instance, **kwargs):
+    catalog_cache.bump(f'book:{instance.book_id}', 'search')
+
+
+@receiver(post_save, sender=BookCategory)
+@receiver(post_delete, sender=BookCategory)
+def book_category_changed_cache(sender, instance, **kwargs):
+    # Книга попадает в выдачу жанра и всех его предков
+    path = Category.objects.filter(pk=instance.category_id).values_list('path', flat=True).first() or ''
+    genre_ids = [part for part in path.strip('/').split('/') if part] or [instance.category_id]
+    catalog_cache.bump('search', 'facets', *[f'genre:{genre_id}' for genre_id in genre_ids])
+
+
+@receiver(post_save, sender=Author)
+def author_saved_cache(sender, instance, created, **kwargs):
+    if not created:
+        book_ids = BookAuthor.objects.filter(author=instance).values_list('book_id', flat=True)
+        catalog_cache.bump('search', *[f'book:{book_id}' for book_id in book_ids])
+
+
+@receiver(post_save, sender=Category)
+def category_saved_cache(sender, instance, created, **kwargs):
+    scopes = ['categories', 'facets']
+    if not created:
+        scopes.append('search')
+    catalog_cache.bump(*scopes)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted_cache(sender, instance, **kwargs):
+    catalog_cache.bump('categories', 'facets')
+
+
+# --- Версии залов и броней (ETag /api/rooms/ и /api/availability/) ---
+
+@receiver(post_save, sender=ReadingRoom)
+@receiver(post_delete, sender=ReadingRoom)
+def reading_room_changed_cache(sender, instance, **kwargs):
+    catalog_cache.bump(f'rooms:branch:{instance.branch_id}')
+
+
+@receiver(post_save, sender=RoomBooking)
+@receiver(post_delete, sender=RoomBooking)
+def room_booking_changed_cache(sender, instance, **kwargs):
+    branch_id = ReadingRoom.objects.filter(pk=instance.room_id).values_list('branch_id', flat=True).first()
+    if branch_id is not None:
+        catalog_cache.bump(booking_scope(branch_id))
+
+
+# --- Расписания залов ---
+
+def _schedule_changed(room_ids):
+    """Сбрасывает расписания и будущий учет мест: сетка слотов могла измениться"""
+    room_ids = list(room_ids)
+    RoomSlotLedger.objects.filter(room_id__in=room_ids, date__gte=timezone.localdate()).delete()
+    # Версия сбрасывает расписание и в других процессах
+    catalog_cache.bump(*(schedules.schedule_scope(room_id) for room_id in room_ids))
+
+    def reset():
+        schedules.invalidate(room_ids)
+        for room_id in room_ids:
+            occupancy_cache.invalidate_room(room_id)
+    transaction.on_commit(reset)
+
+
+@receiver(post_save, sender=ReadingRoom)
+def reading_room_saved_schedule(sender, instance, created, **kwargs):
+    if not created:
+        _schedule_changed([instance.id])
+
+
+@receiver(post_delete, sender=ReadingRoom)
+def reading_room_deleted_schedule(sender, instance, **kwargs):
+    catalog_cache.bump(schedules.schedule_scope(instance.id))
+    transaction.on_commit(lambda: schedules.invalidate([instance.id]))
+
+
+@receiver(post_save, sender=Branch)
+def branch_saved_schedule(sender, instance, created, **kwargs):
+    if not created:
+        _schedule_changed(ReadingRoom.objects.filter(branch=instance).values_list('id', flat=True))
+        catalog_cache.bump(f'rooms:branch:{instance.id}')
+
+
+# --- Учет мест в залах ---
+
+@receiver(pre_save, sender=RoomBooking)
+def room_booking_previous_slot(sender, instance, **kwargs):
+    instance._previous_slot = (
+        RoomBooking.objects.filter(pk=instance.pk).values_list('room_id', 'booking_date').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=RoomBooking)
+def room_booking_saved_ledger(sender, instance, created, **kwargs):
+    # Статус, время, места, зал или дата могли измениться мимо room_ledger - учет
+    # прежнего и нового дня пересчитывается в той же транзакции (для своих броней ничего не меняет)
+    pairs = {(instance.room_id, instance.booking_date), getattr(instance, '_previous_slot', None)}
+    for pair in pairs - {None}:
+        room_ledger.reconcile(*pair)
+
+
+@receiver(post_delete, sender=RoomBooking)
+def room_booking_deleted_ledger(sender, instance, **kwargs):
+    room_ledger.reconcile(instance.room_id, instance.booking_date)
+
+
+# --- Кэш занятости залов ---
+
+@receiver(post_save, sender=RoomBooking)
+def room_booking_saved_occupancy(sender, instance, created, **kwargs):
+    if created and instance.status == 'confirmed':
+        transaction.on_commit(lambda: occupancy_cache.apply(
+            instance.room_id, instance.booking_date, instance.start_time, instance.end_time, instance.seats_count
+        ))
+    elif not created:
+        # Статус, время или дата могли измениться - запись перечитается из базы
+        transaction.on_commit(lambda: occupancy_cache.invalidate_room(instance.room_id))
+
+
+@receiver(post_delete, sender=RoomBooking)
+def room_booking_deleted_occupancy(sender, instance, **kwargs):
+    if instance.status == 'confirmed':
+        transaction.on_commit(lambda: occupancy_cache.apply(
+            instance.room_id, instance.booking_date, instance.start_time, instance.end_time, -instance.seats_count
+        ))
+
+
+# --- Push-обновления доступности (после кэша занятости, чтобы публиковать новые данные) ---
+
+@receiver(post_save, sender=RoomBooking)
+def room_booking_saved_live(sender, instance, created, **kwargs):
+    # Для измененной брони прежний интервал неизвестен - публикуем все слоты зала
+    interval = (instance.start_time, instance.end_time) if created else (None, None)
+    transaction.on_commit(lambda: live.room_changed(instance.room_id, instance.booking_date, *interval))
+
+
+@receiver(post_delete, sender=RoomBooking)
+def room_booking_deleted_live(sender, instance, **kwargs):
+    transaction.on_commit(lambda: live.room_changed(
+        instance.room_id, instance.booking_date, instance.start_time, instance.end_time
+    ))
+
+
+# --- Очередь на книги ---
+
+@receiver(pre_save, sender=BookLoan)
+def book_loan_previous_status(sender, instance, **kwargs):
+    instance._previous_status = (
+        BookLoan.objects.filter(pk=instance.pk).values_list('status', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(pre_save, sender=BookQueue)
+def book_queue_previous_status(sender, instance, **kwargs):
+    instance._previous_status = (
+        BookQueue.objects.filter(pk=instance.pk).values_list('status', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=BookQueue)
+def book_queue_saved_hold(sender, instance, created, **kwargs):
+    # Уведомленный ушел из очереди без брони (выход, истечение, админка) - экземпляр переходит следующему.
+    # completed означает, что отложенный экземпляр забрала бронь (book_queue.claim)
+    if created or instance._previous_status != 'notified' or instance.status in ('notified', 'completed'):
+        return
+    if instance.held_branch_id is not None:
+        book_queue.release_hold(instance.book_id, instance.held_branch_id)
+
+
+@receiver(post_delete, sender=BookQueue)
+def book_queue_deleted_hold(sender, instance, **kwargs):
+    if instance.status == 'notified' and instance.held_branch_id is not None:
+        book_queue.release_hold(instance.book_id, instance.held_branch_id)
+
+
+# --- Учет экземпляров по филиалам ---
+
+def _copy_pair(book_copy_id):
+    return BookCopy.objects.filter(pk=book_copy_id).values_list('book_id', 'branch_id').first()
+
+
+@receiver(post_save, sender=BookLoan)
+def book_loan_saved_inventory(sender, instance, created, **kwargs):
+    # _previous_status заполняет book_loan_previous_status
+    if created:
+        taken = instance.status != 'returned'
+        returned = False
+    else:
+        taken = False
+        returned = instance.status == 'returned' and instance._previous_status not in (None, 'returned')
+    if taken or returned:
+        pair = _copy_pair(instance.book_copy_id)
+        if pair is None:
+            return
+        if taken:
+            inventory.take(*pair)
+        else:
+            # Возвращенный экземпляр откладывается для первого в очереди
+            inventory.put_back(*pair)
+            book_queue.promote(*pair)
+
+
+@receiver(pre_save, sender=BookBooking)
+def book_booking_previous_status(sender, instance, **kwargs):
+    instance._previous_status = (
+        BookBooking.objects.filter(pk=instance.pk).values_list('status', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=BookBooking)
+def book_booking_saved_inventory(sender, instance, created, **kwargs):
+    # Бронь перестала быть активной (отмена, выдача, истечение) - экземпляр снова свободен.
+    # Новые брони резервируют экземпляр сами (inventory.reserve в book_book)
+    active = ('pending', 'ready')
+    if created or instance._previous_status not in active or instance.status in active:
+        return
+    pair = _copy_pair(instance.book_copy_id)
+    if pair is None:
+        return
+    inventory.release(pair[0], instance.branch_id)
+    if instance.status != 'issued':
+        # Выданный экземпляр достается владельцу брони, отмененный - очереди
+        book_queue.promote(pair[0], instance.branch_id)
+
+
+@receiver(post_delete, sender=BookBooking)
+def book_booking_deleted_inventory(sender, instance, **kwargs):
+    # Удаленная активная бронь (админка, удаление пользователя) возвращает экземпляр очереди.
+    # При удалении экземпляра счетчики пересчитает book_copy_changed
+    if instance.status not in ('pending', 'ready'):
+        return
+    pair = _copy_pair(instance.book_copy_id)
+    if pair is None:
+        return
+    inventory.release(pair[0], instance.branch_id)
+    book_queue.promote(pair[0], instance.branch_id)
+
+
+# --- Индекс автодополнения ---
+
+def _suggest_update_on_commit(book_ids):
+    book_ids = list(book_ids)
+    if book_ids:
+        # Версия сбрасывает индекс во всех процессах, включая этот
+        catalog_cache.bump(suggest.VERSION_SCOPE)
+        transaction.on_commit(lambda: suggest.prefix_index.update(book_ids))
+
+
+@receiver(post_save, sender=Book)
+def book_saved_suggest(sender, instance, **kwargs):
+    _suggest_update_on_commit([instance.id])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_suggest(sender, instance, **kwargs):
+    catalog_cache.bump(suggest.VERSION_SCOPE)
+    suggest.prefix_index.remove(instance.id)
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+def book_author_changed_suggest(sender, instance, **kwargs):
+    _suggest_update_on_commit([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def author_saved_suggest(sender, instance, created, **kwargs):
+    if not created:
+        _suggest_update_on_commit(
+            BookAuthor.objects.filter(author=instance).values_list('book_id', flat=True)
+        )
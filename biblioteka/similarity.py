@@ -0,0 +1,208 @@
+# biblioteka/similarity.py
+"""
+Офлайн-расчет похожих книг.
+
+Каждая книга описывается тремя бинарными векторами признаков: категории,
+авторы и читатели, бравшие книгу (совместные выдачи). Строки каждого блока
+нормируются, блоки взвешиваются и склеиваются, так что скалярное произведение
+строк равно взвешенной сумме косинусных сходств. Матрица признаков хранится
+разреженно (FeatureMatrix): у книги единицы признаков, а читателей - сотни
+тысяч, поэтому плотная книга x признак не помещается в память. Сходство
+считается блоками строк, для каждой книги сохраняются top-k соседей в SimilarBook.
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from .models import Book, BookAuthor, BookCategory, BookLoan, SimilarBook
+
+
+DEFAULT_TOP_K = 5
+DEFAULT_WEIGHTS = {
+    'categories': 0.4,
+    'authors': 0.35,
+    'loans': 0.25,
+}
+# Строк в блоке сходства: блок - плотный массив BLOCK_SIZE x число книг
+BLOCK_SIZE = 128
+
+
+def _feature_pairs():
+    """Пары (book_id, признак) для каждого блока признаков"""
+    return {
+        'categories': BookCategory.objects.values_list('book_id', 'category_id'),
+        'authors': BookAuthor.objects.values_list('book_id', 'author_id'),
+        'loans': BookLoan.objects.values_list('book_copy__book_id', 'user_id').distinct(),
+    }
+
+
+class FeatureMatrix:
+    """
+    Разреженная матрица книга x признак: строки (CSR) для книг блока и
+    столбцы (CSC) для книг с тем же признаком. Хранит только ненулевые значения.
+    """
+
+    def __init__(self, rows, columns, values, shape):
+        self.shape = shape
+        self.row_ptr, self.row_columns, self.row_values = self._compress(rows, columns, values, shape[0])
+        self.column_ptr, self.column_rows, self.column_values = self._compress(columns, rows, values, shape[1])
+
+    @staticmethod
+    def _compress(keys, items, values, size):
+        order = np.argsort(keys, kind='stable')
+        ptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=size), out=ptr[1:])
+        return ptr, items[order], values[order]
+
+    def similarity(self, rows):
+        """Плотный блок скалярных произведений строк rows со всеми строками, форма (len(rows), shape[0])"""
+        rows = np.asarray(rows, dtype=np.int64)
+        count = self.shape[0]
+        # Ненулевые элементы строк блока
+        lengths = self.row_ptr[rows + 1] - self.row_ptr[rows]
+        positions = _ranges(self.row_ptr[rows], lengths)
+        local = np.repeat(np.arange(len(rows)), lengths)
+        columns = self.row_columns[positions]
+        values = self.row_values[positions]
+        # Каждый элемент умножается на столбец своего признака
+        lengths = self.column_ptr[columns + 1] - self.column_ptr[columns]
+        positions = _ranges(self.column_ptr[columns], lengths)
+        targets = np.repeat(local, lengths) * count + self.column_rows[positions]
+        weights = np.repeat(values, lengths) * self.column_values[positions]
+        result = np.bincount(targets, weights=weights, minlength=len(rows) * count)
+        return result.astype(np.float32).reshape(len(rows), count)
+
+
+def _ranges(starts, lengths):
+    """Склеенные диапазоны [start, start + length) без цикла по диапазонам"""
+    total = int(lengths.sum())
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(total, dtype=np.int64) - offsets
+
+
+def _feature_block(pairs, book_index):
+    """
+    Ненулевые элементы нормированной по строкам матрицы книга x признак: (строки, столбцы, значения, число столбцов).
+    Признаки, встречающиеся у одной книги, не влияют на сходство и отбрасываются.
+    """
+    books_by_feature = defaultdict(set)
+    for book_id, feature in pairs:
+        if book_id in book_index:
+            books_by_feature[feature].add(book_index[book_id])
+    shared = [rows for rows in books_by_feature.values() if len(rows) > 1]
+
+    lengths = np.fromiter((len(rows) for rows in shared), dtype=np.int64, count=len(shared))
+    rows = np.fromiter((row for books in shared for row in books), dtype=np.int64, count=int(lengths.sum()))
+    columns = np.repeat(np.arange(len(shared), dtype=np.int64), lengths)
+    # Норма бинарной строки - корень из числа ее признаков
+    norms = np.sqrt(np.bincount(rows, minlength=len(book_index)))
+    values = (1.0 / norms[rows]) if len(rows) else np.zeros(0)
+    return rows, columns, values.astype(np.float32), len(shared)
+
+
+def build_feature_matrix(weights=None):
+    """Возвращает (массив id книг, FeatureMatrix признаков)"""
+    weights = weights or DEFAULT_WEIGHTS
+    book_ids = np.fromiter(Book.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    book_index = {int(book_id): i for i, book_id in enumerate(book_ids)}
+
+    rows, columns, values, width = [], [], [], 0
+    for name, pairs in _feature_pairs().items():
+        weight = weights.get(name, 0)
+        if weight <= 0:
+            continue
+        block_rows, block_columns, block_values, block_width = _feature_block(pairs, book_index)
+        rows.append(block_rows)
+        columns.append(block_columns + width)
+        values.append(block_values * np.float32(np.sqrt(weight)))
+        width += block_width
+
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return book_ids, FeatureMatrix(empty, empty, np.zeros(0, dtype=np.float32), (len(book_ids), 0))
+    return book_ids, FeatureMatrix(
+        np.concatenate(rows), np.concatenate(columns), np.concatenate(values), (len(book_ids), width)
+    )
+
+
+def top_neighbours(features, rows, top_k=DEFAULT_TOP_K):
+    """
+    Для строк rows возвращает (индексы соседей, оценки) формы (len(rows), top_k).
+    Отсутствующие соседи помечены индексом -1.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    count = features.shape[0]
+    k = min(top_k, max(count - 1, 0))
+    neighbours = np.full((len(rows), top_k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), top_k), dtype=np.float32)
+    if k == 0 or features.shape[1] == 0:
+        return neighbours, scores
+
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+        similarity = features.similarity(block)
+        similarity[np.arange(len(block)), block] = -np.inf
+
+        candidates = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(similarity, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+        positive = candidate_scores > 0
+        neighbours[start:start + len(block), :k] = np.where(positive, candidates, -1)
+        scores[start:start + len(block), :k] = np.where(positive, candidate_scores, 0)
+    return neighbours, scores
+
+
+def affected_rows(features, rows):
+    """Строки книг, у которых есть общий признак с книгами rows (включая сами rows)"""
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0 or features.shape[1] == 0:
+        return rows
+    touched = np.zeros(features.shape[0], dtype=bool)
+    touched[rows] = True
+    for start in range(0, len(rows), BLOCK_SIZE):
+        similarity = features.similarity(rows[start:start + BLOCK_SIZE])
+        touched |= (similarity > 0).any(axis=0)
+    return np.flatnonzero(touched)
+
+
+def rebuild_similar_books(book_ids=None, top_k=DEFAULT_TOP_K, weights=None):
+    """
+    Пересчитывает соседей всех книг или только book_ids и книг, связанных с ними.
+    Возвращает количество обновленных книг.
+    """
+    all_ids, features = build_feature_matrix(weights)
+    if book_ids is None:
+        rows = np.arange(len(all_ids))
+    else:
+        index = {int(book_id): i for i, book_id in enumerate(all_ids)}
+        rows = affected_rows(features, [index[book_id] for book_id in book_ids if book_id in index])
+
+    neighbours, scores = top_neighbours(features, rows, top_k)
+
+    entries = []
+    for row, row_neighbours, row_scores in zip(rows, neighbours, scores):
+        rank = 0
+        for neighbour, score in zip(row_neighbours, row_scores):
+            if neighbour < 0:
+                break
+            rank += 1
+            entries.append(SimilarBook(
+                book_id=int(all_ids[row]),
+                similar_id=int(all_ids[neighbour]),
+                score=float(score),
+                rank=rank,
+            ))
+
+    updated_ids = [int(all_ids[row]) for row in rows]
+    with transaction.atomic():
+        if book_ids is None:
+            SimilarBook.objects.all().delete()
+        else:
+            # Соседи удаленных книг удаляются каскадом, чистим только пересчитанные
+            SimilarBook.objects.filter(book_id__in=updated_ids).delete()
+        SimilarBook.objects.bulk_create(entries, batch_size=1000)
+    return len(updated_ids)
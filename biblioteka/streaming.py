@@ -0,0 +1,81 @@
+# biblioteka/streaming.py
+"""
+Потоковая выдача больших списков: элементы сериализуются по мере чтения
+из базы, поэтому память не растет с размером выборки.
+
+Под ASGI ответ получает асинхронный итератор: синхронный генератор Django
+собрал бы целиком через sync_to_async(list). Пачки по-прежнему читаются
+синхронным кодом в общем потоке sync-кода, по одной на шаг итерации.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+CHUNK_SIZE = 500
+
+# Признак конца синхронного генератора (StopIteration нельзя пробросить через await)
+_DONE = object()
+
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _dumps(item):
+    return json.dumps(item, cls=DjangoJSONEncoder)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(_dumps(item))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def json_array_stream(items, key, size=CHUNK_SIZE):
+    """{"<key>": [...]} - элементы массива отдаются пачками по size"""
+    yield '{%s: [' % _dumps(key)
+    first = True
+    for batch in _batches(items, size):
+        yield ('' if first else ',') + ','.join(batch)
+        first = False
+    yield ']}'
+
+
+def ndjson_stream(items, size=CHUNK_SIZE):
+    """Один JSON-объект на строку"""
+    for batch in _batches(items, size):
+        yield '\n'.join(batch) + '\n'
+
+
+async def async_stream(chunks):
+    """Асинхронная обертка над синхронным генератором пачек"""
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        # Курсор базы закрывается в том же потоке, где открыт
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def streaming_response(items, fmt, key, size=CHUNK_SIZE, asynchronous=False):
+    """asynchronous=True - для запросов через ASGI"""
+    if fmt == 'ndjson':
+        content = ndjson_stream(items, size)
+    else:
+        content = json_array_stream(items, key, size)
+    if asynchronous:
+        content = async_stream(content)
+    return StreamingHttpResponse(content, content_type=FORMATS[fmt])
@@ -0,0 +1,152 @@
+# biblioteka/suggest.py
+"""
+Автодополнение для строки поиска каталога.
+
+Префиксный индекс - отсортированный список (ключ, приоритет, book_id), где ключ -
+нормализованное название или имя автора, начиная с каждого слова. Поиск префикса
+выполняется через bisect, изменения книг вносятся в индекс точечно.
+
+Индекс живет в памяти процесса и помнит версию области 'suggest' (catalog_cache),
+при которой построен. Сигналы меняют версию при изменении названий и авторов,
+поиск сверяет ее одним запросом и перестраивает индекс, если книги правили в
+другом процессе.
+"""
+import re
+import threading
+from bisect import bisect_left, insort
+
+from . import catalog_cache
+from .models import Book
+
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+# Сколько совпадений просматривается для ранжирования на коротких префиксах
+SCAN_LIMIT = 400
+
+# Область версий индекса в catalog_cache
+VERSION_SCOPE = 'suggest'
+
+# Приоритеты совпадений: начало названия, слово в названии, автор
+TITLE_START, TITLE_WORD, AUTHOR = 0, 1, 2
+
+_SPACES_RE = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    return _SPACES_RE.sub(' ', (text or '').lower().replace('ё', 'е')).strip()
+
+
+def _word_suffixes(text):
+    """'война и мир' -> ['война и мир', 'и мир', 'мир']"""
+    words = text.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = []
+        self._book_entries = {}
+        self._books = {}
+        self._token = None
+        self.is_built = False
+
+    def build(self):
+        # Версия читается до книг: правка между запросами вызовет повторную сборку
+        token = catalog_cache.versions([VERSION_SCOPE])[0]
+        rows = Book.objects.values_list('id', 'title', 'authors_display')
+        with self._lock:
+            self._token = token
+            self._entries = []
+            self._book_entries = {}
+            self._books = {}
+            for book_id, title, authors in rows:
+                for entry in self._make_entries(book_id, title, authors):
+                    self._entries.append(entry)
+            self._entries.sort()
+            self.is_built = True
+
+    def update(self, book_ids):
+        """Переиндексирует книги; если индекс еще не построен, ничего не делает"""
+        with self._lock:
+            if not self.is_built:
+                return
+            rows = Book.objects.filter(id__in=book_ids).values_list('id', 'title', 'authors_display')
+            for book_id in book_ids:
+                self._remove(book_id)
+            for book_id, title, authors in rows:
+                for entry in self._make_entries(book_id, title, authors):
+                    insort(self._entries, entry)
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def reset(self):
+        with self._lock:
+            self._entries = []
+            self._book_entries = {}
+            self._books = {}
+            self._token = None
+            self.is_built = False
+
+    def is_current(self):
+        """Построен ли индекс при текущей версии (один запрос к CatalogVersion)"""
+        return self.is_built and self._token == catalog_cache.versions([VERSION_SCOPE])[0]
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if not self.is_current():
+            self.build()
+
+        with self._lock:
+            start = bisect_left(self._entries, (prefix,))
+            matches = []
+            for key, priority, book_id in self._entries[start:start + SCAN_LIMIT]:
+                if not key.startswith(prefix):
+                    break
+                matches.append((priority, len(key), book_id))
+
+            matches.sort()
+            result = []
+            seen = set()
+            for _, _, book_id in matches:
+                if book_id in seen:
+                    continue
+                seen.add(book_id)
+                title, authors = self._books[book_id]
+                result.append({'id': book_id, 'title': title, 'authors': authors or "Не указан"})
+                if len(result) >= limit:
+                    break
+            return result
+
+    def _make_entries(self, book_id, title, authors):
+        entries = set()
+        title_key = normalize(title)
+        if title_key:
+            entries.add((title_key, TITLE_START, book_id))
+            for suffix in _word_suffixes(title_key)[1:]:
+                entries.add((suffix, TITLE_WORD, book_id))
+        for name in (authors or '').split(','):
+            for suffix in _word_suffixes(normalize(name)):
+                entries.add((suffix, AUTHOR, book_id))
+        self._book_entries[book_id] = list(entries)
+        self._books[book_id] = (title, authors)
+        return entries
+
+    def _remove(self, book_id):
+        for entry in self._book_entries.pop(book_id, ()):
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+        self._books.pop(book_id, None)
+
+
+prefix_index = PrefixIndex()
+
+
+def suggest_books(query, limit=DEFAULT_LIMIT):
+    return prefix_index.suggest(query, limit)
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from biblioteka import book_queue, inventory, overdue
+from biblioteka.models import Book, BookBooking, BookCopy, BookInventory, BookQueue, Branch
+
+
+class BookQueueTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        self.book = Book.objects.create(title='Война и мир')
+        self.copy = BookCopy.objects.create(book=self.book, branch=self.branch, book_count=1)
+        inventory.rebuild([(self.book.id, self.branch.id)])
+
+    def _counters(self):
+        return BookInventory.objects.values_list('available', 'reserved').get(book=self.book, branch=self.branch)
+
+    def _user(self, username):
+        return User.objects.create_user(username=username, password='p')
+
+    def _book(self, user):
+        self.client.force_login(user)
+        return self.client.post(f'/books/{self.book.id}/book/', b'{}', content_type='application/json').json()
+
+    def _cancel_first_booking(self):
+        booking = BookBooking.objects.get(status='ready')
+        self.client.force_login(booking.user)
+        self.assertTrue(self.client.post(f'/books/booking/{booking.id}/cancel/').json()['success'])
+
+    def test_freed_copy_is_held_for_head_only(self):
+        self._book(self._user('owner'))
+        first = book_queue.enqueue(self._user('first'), self.book.id)
+        second = book_queue.enqueue(self._user('second'), self.book.id, self.branch.id)
+
+        self._cancel_first_booking()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.held_branch_id), ('notified', self.branch.id))
+        self.assertEqual(second.status, 'waiting')
+        # Экземпляр отложен: в available его нет
+        self.assertEqual(self._counters(), (0, 1))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_count, 0)
+
+    def test_held_copy_goes_to_notified_user_only(self):
+        self._book(self._user('owner'))
+        notified = self._user('notified')
+        entry = book_queue.enqueue(notified, self.book.id)
+        self._cancel_first_booking()
+
+        self.assertFalse(self._book(self._user('outsider'))['success'])
+        self.assertTrue(self._book(notified)['success'])
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'completed')
+        self.assertEqual(BookBooking.objects.get(status='ready').user, notified)
+        self.assertEqual(self._counters(), (0, 1))
+
+    def test_no_promotion_without_free_copy(self):
+        self._book(self._user('owner'))
+        entry = book_queue.enqueue(self._user('first'), self.book.id)
+
+        self.assertEqual(book_queue.promote(self.book.id, self.branch.id), [])
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'waiting')
+
+    def test_dequeue_passes_hold_to_next(self):
+        self._book(self._user('owner'))
+        first_user = self._user('first')
+        first = book_queue.enqueue(first_user, self.book.id)
+        second = book_queue.enqueue(self._user('second'), self.book.id)
+        self._cancel_first_booking()
+
+        book_queue.dequeue(first_user, first.id)
+
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'notified')
+        self.assertEqual(self._counters(), (0, 1))
+
+        book_queue.dequeue(second.user, second.id)
+        self.assertEqual(self._counters(), (1, 0))
+
+    def test_stale_hold_expires(self):
+        self._book(self._user('owner'))
+        first = book_queue.enqueue(self._user('first'), self.book.id)
+        second = book_queue.enqueue(self._user('second'), self.book.id)
+        self._cancel_first_booking()
+
+        later = timezone.now() + timedelta(days=book_queue.HOLD_DAYS, hours=1)
+        self.assertEqual(overdue.sweep_overdue(later)[3], 1)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'cancelled')
+        self.assertEqual(second.status, 'notified')
+        self.assertEqual(self._counters(), (0, 1))
+
+    def test_rebuild_counts_holds(self):
+        self._book(self._user('owner'))
+        book_queue.enqueue(self._user('first'), self.book.id)
+        self._cancel_first_booking()
+
+        inventory.rebuild()
+        self.assertEqual(self._counters(), (0, 1))
+
+    def test_joining_with_free_copy_is_notified_at_once(self):
+        entry = book_queue.enqueue(self._user('first'), self.book.id)
+
+        self.assertEqual((entry.status, entry.held_branch_id), ('notified', self.branch.id))
+        self.assertEqual(self._counters(), (0, 1))
+        # Следующему свободных экземпляров уже нет
+        self.assertEqual(book_queue.enqueue(self._user('second'), self.book.id, self.branch.id).status, 'waiting')
+
+    def test_rank_is_per_branch(self):
+        BookCopy.objects.filter(pk=self.copy.pk).update(status='lost')
+        inventory.rebuild([(self.book.id, self.branch.id)])
+        other = Branch.objects.create(name='Филиал', address='ул. Баумана, 2')
+        book_queue.enqueue(self._user('a'), self.book.id, other.id)
+        book_queue.enqueue(self._user('b'), self.book.id)
+        here = book_queue.enqueue(self._user('c'), self.book.id, self.branch.id)
+        anywhere = book_queue.enqueue(self._user('d'), self.book.id)
+
+        ranks = dict(BookQueue.objects.with_rank().values_list('pk', 'rank'))
+        self.assertEqual(ranks[here.pk], 1)
+        self.assertEqual(ranks[anywhere.pk], 2)
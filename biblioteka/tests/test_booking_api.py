@@ -0,0 +1,19 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+
+class BookingApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='reader', password='p'))
+
+    def test_non_object_body_is_rejected(self):
+        for url in ('/api/book/', '/api/book/batch/'):
+            for body in ('[]', '"items"', '42', 'null'):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (url, body))
+
+    def test_malformed_seats_are_rejected(self):
+        response = self.client.post('/api/book/', {
+            'room_id': 1, 'date': '2030-01-01', 'start': '10:00', 'end': '11:00', 'seats': 'two',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,48 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase
+
+from biblioteka import catalog_cache
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        caches[catalog_cache.CACHE_ALIAS].clear()
+
+    def test_bump_from_other_process_invalidates_page(self):
+        filters = catalog_cache.normalize_filters('all', 'all', '', '', 20)
+        _, key, _ = catalog_cache.get(filters)
+        catalog_cache.put(key, {'books': []}, [])
+        self.assertIsNotNone(catalog_cache.get(filters)[0])
+
+        # Другой процесс (clock, второй воркер) со своим локальным кэшем
+        other_process = LocMemCache('other-process', {})
+        with mock.patch.object(catalog_cache, '_cache', lambda: other_process):
+            with self.captureOnCommitCallbacks(execute=True):
+                catalog_cache.bump('all')
+
+        self.assertIsNone(catalog_cache.get(filters)[0])
+
+    def test_book_bump_invalidates_pages_with_that_book(self):
+        filters = catalog_cache.normalize_filters('1', 'all', '', '', 20)
+        _, key, _ = catalog_cache.get(filters)
+        catalog_cache.put(key, {'books': [7]}, [7])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_cache.bump('book:8')
+        self.assertIsNotNone(catalog_cache.get(filters)[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_cache.bump('book:7')
+        self.assertIsNone(catalog_cache.get(filters)[0])
+
+    def test_catalog_page_shares_facets_with_api(self):
+        self.client.get('/catalog/')
+        filters = catalog_cache.normalize_filters(None, None, '', None, None)
+        self.assertIsNotNone(catalog_cache.get_facets(filters)[0])
+
+        catalog_cache.reset_stats()
+        self.client.get('/catalog/')
+        self.assertEqual(catalog_cache.stats()['misses'], 0)
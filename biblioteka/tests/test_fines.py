@@ -0,0 +1,65 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from biblioteka import fines
+from biblioteka.models import Book, BookCopy, BookLoan, Branch, Fine
+
+
+class FineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='p')
+        branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        book = Book.objects.create(title='Война и мир', price=Decimal('800.00'))
+        copy = BookCopy.objects.create(book=book, branch=branch, book_count=1)
+        self.loan = BookLoan.objects.create(
+            user=self.user, book_copy=copy, due_date=timezone.now() - timedelta(days=5),
+        )
+
+    def test_repeated_run_is_idempotent(self):
+        self.assertEqual(fines.assess_fines(), {'created': 1, 'updated': 0})
+        self.assertEqual(fines.assess_fines(), {'created': 0, 'updated': 0})
+        self.assertEqual(Fine.objects.filter(loan=self.loan, status='unpaid').count(), 1)
+
+    def test_cancelled_payment_does_not_waive(self):
+        fines.assess_fines()
+        Fine.objects.update(status='cancelled')
+
+        self.assertEqual(fines.assess_fines()['created'], 1)
+        self.assertTrue(Fine.objects.filter(loan=self.loan, status='unpaid').exists())
+
+    def test_waived_and_paid_loans_are_skipped(self):
+        fines.assess_fines()
+        for status in ('waived', 'paid'):
+            Fine.objects.update(status=status)
+            self.assertEqual(fines.assess_fines(), {'created': 0, 'updated': 0})
+
+    def test_mark_lost_replaces_overdue_fine(self):
+        fines.assess_fines()
+        self.client.force_login(self.user)
+        data = self.client.post(f'/loans/{self.loan.id}/mark-lost/').json()
+
+        self.assertTrue(data['success'])
+        self.assertEqual(data['book_price'], 800.0)
+        self.assertEqual(Fine.objects.get(status='unpaid').id, data['fine_id'])
+
+    def test_mark_lost_without_fine_is_rejected(self):
+        fines.assess_fines()
+        Fine.objects.update(status='waived')
+        self.client.force_login(self.user)
+        response = self.client.post(f'/loans/{self.loan.id}/mark-lost/')
+
+        self.assertEqual(response.status_code, 400)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, 'overdue')
+
+    def test_payment_without_fine_is_not_found(self):
+        BookLoan.objects.filter(pk=self.loan.pk).update(status='lost')
+        Fine.objects.create(user=self.user, loan=self.loan, amount=Decimal('800.00'), reason='-', status='waived')
+        self.client.force_login(self.user)
+        response = self.client.post(f'/loans/{self.loan.id}/pay-fine/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(response.status_code, 404)
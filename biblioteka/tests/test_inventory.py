@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from biblioteka import book_queue, inventory, overdue
+from biblioteka.models import Book, BookBooking, BookCopy, BookInventory, Branch
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        self.book = Book.objects.create(title='Война и мир')
+        self.copy = BookCopy.objects.create(book=self.book, branch=self.branch, book_count=1)
+        inventory.rebuild([(self.book.id, self.branch.id)])
+
+    def _counters(self):
+        return BookInventory.objects.values_list('available', 'reserved').get(book=self.book, branch=self.branch)
+
+    def _book(self, username):
+        user = User.objects.create_user(username=username, password='p')
+        self.client.force_login(user)
+        return self.client.post(f'/books/{self.book.id}/book/', b'{}', content_type='application/json').json()
+
+    def test_last_copy_is_reserved_once(self):
+        self.assertTrue(self._book('first')['success'])
+        self.assertFalse(self._book('second')['success'])
+        self.assertEqual(self._counters(), (0, 1))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_count, 0)
+
+    def test_stale_counter_is_rebuilt_after_rollback(self):
+        """Счетчик разошелся с экземплярами: бронь откатывается, а учет пересчитывается"""
+        BookCopy.objects.filter(pk=self.copy.pk).update(status='lost')
+        self.assertEqual(self._counters(), (1, 0))
+
+        self.assertFalse(self._book('first')['success'])
+        self.assertEqual(self._counters(), (0, 0))
+        self.assertFalse(BookBooking.objects.exists())
+
+    def test_release_returns_copy(self):
+        self._book('first')
+        booking = BookBooking.objects.get()
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self._counters(), (1, 0))
+
+    def test_rebuild_keeps_unswept_expired_booking(self):
+        """Просроченная бронь остается в reserved до sweep, иначе sweep вернул бы экземпляр дважды"""
+        self._book('first')
+        BookBooking.objects.update(pickup_deadline=timezone.now() - timedelta(hours=1))
+        inventory.rebuild([(self.book.id, self.branch.id)])
+        self.assertEqual(self._counters(), (0, 1))
+
+        overdue.expire_bookings()
+        self.assertEqual(self._counters(), (1, 0))
+
+    def test_deleted_booking_goes_to_queue(self):
+        self._book('first')
+        waiting = book_queue.enqueue(User.objects.create_user(username='waiting', password='p'), self.book.id)
+
+        BookBooking.objects.get().delete()
+
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.status, 'notified')
+        self.assertEqual(self._counters(), (0, 1))
+
+    def test_deleted_booking_without_queue_frees_copy(self):
+        self._book('first')
+        BookBooking.objects.get().user.delete()
+        self.assertEqual(self._counters(), (1, 0))
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from biblioteka import book_queue, inventory, overdue
+from biblioteka.models import Book, BookBooking, BookCopy, BookInventory, BookLoan, Branch
+
+
+class ExpireBookingsTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        self.book = Book.objects.create(title='Война и мир')
+        self.copy = BookCopy.objects.create(book=self.book, branch=self.branch, book_count=3)
+        self.now = timezone.now()
+
+    def _booking(self, username, status='ready', days=-1):
+        user = User.objects.create_user(username=username, password='p')
+        return BookBooking.objects.create(
+            user=user, book_copy=self.copy, branch=self.branch, status=status,
+            pickup_deadline=self.now + timedelta(days=days),
+        )
+
+    def _counters(self):
+        return BookInventory.objects.values_list('available', 'reserved').get(book=self.book, branch=self.branch)
+
+    def test_only_expired_bookings_are_released(self):
+        expired = self._booking('late')
+        current = self._booking('current', days=2)
+        self._booking('gone', status='cancelled')
+        inventory.rebuild([(self.book.id, self.branch.id)])
+        self.assertEqual(self._counters(), (1, 2))
+
+        self.assertEqual(overdue.expire_bookings(self.now), 1)
+
+        expired.refresh_from_db()
+        current.refresh_from_db()
+        self.assertEqual((expired.status, current.status), ('expired', 'ready'))
+        self.assertEqual(self._counters(), (2, 1))
+        # Повторный проход ничего не освобождает
+        self.assertEqual(overdue.expire_bookings(self.now), 0)
+        self.assertEqual(self._counters(), (2, 1))
+
+    def test_released_copies_are_held_for_queue(self):
+        self._booking('late')
+        self._booking('later')
+        BookCopy.objects.filter(pk=self.copy.pk).update(book_count=2)
+        inventory.rebuild([(self.book.id, self.branch.id)])
+        entry = book_queue.enqueue(User.objects.create_user(username='waiting', password='p'), self.book.id)
+
+        self.assertEqual(overdue.expire_bookings(self.now), 2)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'notified')
+        self.assertEqual(self._counters(), (1, 1))
+
+
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='p')
+        self.branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        self.book = Book.objects.create(title='Война и мир')
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+
+    def _loans(self, count, due):
+        copy = BookCopy.objects.create(book=self.book, branch=self.branch, book_count=count)
+        loans = [
+            BookLoan.objects.create(user=self.user, book_copy=copy, due_date=self.now + timedelta(days=1))
+            for _ in range(count)
+        ]
+        # save() сам ставит overdue, поэтому срок сдвигается в обход модели
+        BookLoan.objects.filter(pk__in=[loan.pk for loan in loans]).update(due_date=due)
+        return loans
+
+    def test_overdue_loans_are_marked_in_chunks(self):
+        late = self._loans(3, self.now - timedelta(days=1))
+        on_time = self._loans(1, self.now + timedelta(days=1))
+        returned = self._loans(1, self.now - timedelta(days=1))
+        BookLoan.objects.filter(pk=returned[0].pk).update(status='returned', return_date=self.now)
+
+        self.assertEqual(overdue.sweep_loans(self.now, chunk_size=2), 3)
+
+        statuses = dict(BookLoan.objects.values_list('pk', 'status'))
+        self.assertEqual({statuses[loan.pk] for loan in late}, {'overdue'})
+        self.assertEqual((statuses[on_time[0].pk], statuses[returned[0].pk]), ('active', 'returned'))
+        self.assertEqual(overdue.sweep_loans(self.now, chunk_size=2), 0)
+
+    def test_overdue_copy_leaves_inventory(self):
+        copy = BookCopy.objects.create(book=self.book, branch=self.branch, book_count=2)
+        BookCopy.objects.filter(pk=copy.pk).update(return_date=self.today - timedelta(days=1))
+        inventory.rebuild([(self.book.id, self.branch.id)])
+
+        self.assertEqual(overdue.sweep_copies(self.today), 1)
+
+        copy.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual(copy.status, 'overdue')
+        self.assertEqual(self.book.available_count, 0)
+        self.assertEqual(
+            BookInventory.objects.values_list('available', 'reserved').get(book=self.book, branch=self.branch),
+            (0, 0),
+        )
@@ -0,0 +1,110 @@
+from datetime import time, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+
+from biblioteka import catalog_cache, room_ledger, schedules
+from biblioteka.models import Branch, ReadingRoom, RoomBooking, RoomSlotLedger
+from biblioteka.occupancy import occupancy_cache
+
+
+class RoomLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='p')
+        branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        self.room = ReadingRoom.objects.create(branch=branch, name='Зал 1', total_seats=4, available_seats=4)
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.booking = room_ledger.book_room(self.user, self.room, self.day, time(10), time(12), seats=2)
+
+    def _seats(self, day=None):
+        return dict(RoomSlotLedger.objects.filter(room=self.room, date=day or self.day).values_list(
+            'slot_start', 'booked_seats'
+        ))
+
+    def test_booking_fills_ledger(self):
+        seats = self._seats()
+        self.assertEqual((seats[time(10)], seats[time(11)], seats[time(12)]), (2, 2, 0))
+
+    def test_plain_save_reconciles_ledger(self):
+        self.booking.status = 'cancelled'
+        self.booking.save()
+        self.assertEqual(self._seats()[time(10)], 0)
+
+        self.booking.status = 'confirmed'
+        self.booking.seats_count = 3
+        self.booking.start_time, self.booking.end_time = time(11), time(13)
+        self.booking.save()
+        seats = self._seats()
+        self.assertEqual((seats[time(10)], seats[time(11)], seats[time(12)]), (0, 3, 3))
+
+    def test_moved_booking_frees_previous_day(self):
+        room_ledger.ensure_ledger(self.room.id, self.day + timedelta(days=1))
+        self.booking.booking_date = self.day + timedelta(days=1)
+        self.booking.save()
+
+        self.assertEqual(self._seats()[time(10)], 0)
+        self.assertEqual(self._seats(self.booking.booking_date)[time(10)], 2)
+
+    def test_plain_delete_frees_seats(self):
+        self.booking.delete()
+        self.assertEqual(self._seats()[time(10)], 0)
+        # Места снова можно забронировать целиком
+        room_ledger.book_room(self.user, self.room, self.day, time(10), time(11), seats=4)
+
+    def test_concurrent_insert_becomes_booking_error(self):
+        before = self._seats()
+        items = [(self.room, self.day, time(14), time(15), 1)]
+        with mock.patch.object(RoomBooking.objects, 'bulk_create', side_effect=IntegrityError):
+            created, errors = room_ledger.book_rooms(self.user, items)
+
+        self.assertEqual(created, {})
+        self.assertEqual(list(errors), [0])
+        self.assertEqual(self._seats(), before)
+
+    def test_schedule_change_from_other_process_is_seen(self):
+        self.assertEqual(schedules.room_schedule(self.room.id).slot_minutes, 60)
+
+        # Другой процесс сохранил зал: JSON и версия в базе новые, локальный кэш прежний
+        ReadingRoom.objects.filter(pk=self.room.pk).update(opening_hours={'slot_minutes': 30})
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_cache.bump(schedules.schedule_scope(self.room.id))
+
+        self.assertEqual(schedules.room_schedule(self.room.id).slot_minutes, 30)
+
+
+class OccupancyCacheTests(TestCase):
+    def setUp(self):
+        occupancy_cache.reset()
+        self.user = User.objects.create_user(username='reader', password='p')
+        self.branch = Branch.objects.create(name='Центральная', address='ул. Кремлевская, 1')
+        self.room = ReadingRoom.objects.create(branch=self.branch, name='Зал 1', total_seats=4, available_seats=4)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def _free(self):
+        response = self.client.get('/api/availability/', {'branch': self.branch.id, 'hall': 'reading', 'date': self.day.isoformat()})
+        return response, response.json()['rooms'][0]['slots'][2]['free']
+
+    def test_booking_from_other_process_refreshes_body_with_etag(self):
+        before, free = self._free()
+        self.assertEqual(free, 4)
+
+        # Бронь в другом процессе: база и версия меняются, локальный кэш занятости - нет
+        with mock.patch.object(occupancy_cache, 'apply'), mock.patch.object(occupancy_cache, 'invalidate_room'):
+            with self.captureOnCommitCallbacks(execute=True):
+                room_ledger.book_room(self.user, self.room, self.day, time(10), time(11), seats=3)
+
+        after, free = self._free()
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(free, 1)
+
+    def test_day_response_carries_slot_minutes(self):
+        ReadingRoom.objects.filter(pk=self.room.pk).update(opening_hours={'slot_minutes': 30})
+        schedules.invalidate()
+        # Версия в базе откатывается вместе с тестом, а расписание осталось бы в памяти
+        self.addCleanup(schedules.invalidate)
+
+        room = self._free()[0].json()['rooms'][0]
+        self.assertEqual((room['slot_minutes'], room['slots'][0]['end']), (30, '08:30'))
@@ -0,0 +1,28 @@
+import numpy as np
+from django.test import TestCase
+
+from biblioteka import similarity
+from biblioteka.models import Book, BookCategory, Category, SimilarBook
+
+
+class SimilarityTests(TestCase):
+    def setUp(self):
+        novels, poetry = Category.objects.create(name='Романы'), Category.objects.create(name='Поэзия')
+        self.books = [Book.objects.create(title=f'Книга {i}', isbn=f'978-5-00000-00{i}-0') for i in range(4)]
+        for book, category in zip(self.books, (novels, novels, poetry, poetry)):
+            BookCategory.objects.create(book=book, category=category)
+
+    def test_sparse_similarity_matches_dense_product(self):
+        _, features = similarity.build_feature_matrix()
+        dense = np.zeros(features.shape, dtype=np.float32)
+        for row in range(features.shape[0]):
+            start, end = features.row_ptr[row], features.row_ptr[row + 1]
+            dense[row, features.row_columns[start:end]] = features.row_values[start:end]
+
+        np.testing.assert_allclose(features.similarity(np.arange(len(self.books))), dense @ dense.T, atol=1e-6)
+
+    def test_neighbours_share_category(self):
+        self.assertEqual(similarity.rebuild_similar_books(), 4)
+        neighbours = dict(SimilarBook.objects.values_list('book_id', 'similar_id'))
+        first, second, third, fourth = (book.id for book in self.books)
+        self.assertEqual(neighbours, {first: second, second: first, third: fourth, fourth: third})
@@ -0,0 +1,33 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from biblioteka import views
+from biblioteka.models import Book
+
+
+class BookStreamTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            Book.objects.create(title=f'Книга {i}', isbn=f'978-5-00000-00{i}-0')
+
+    async def test_asgi_stream_is_not_buffered(self):
+        with mock.patch.object(views, 'STREAM_CHUNK_SIZE', 1), \
+                mock.patch.object(views, 'serialize', wraps=views.serialize) as serialize:
+            response = await self.async_client.get('/api/books/', {'stream': 'ndjson'})
+            self.assertTrue(response.is_async)
+
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            # Отдана первая пачка, остальные книги еще не прочитаны
+            self.assertEqual(serialize.call_count, 1)
+            rest = [chunk async for chunk in chunks]
+
+        lines = b''.join([first, *rest]).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Книга 0', 'Книга 1', 'Книга 2'])
+
+    def test_wsgi_stream_stays_sync(self):
+        response = self.client.get('/api/books/', {'stream': 'json'})
+        self.assertFalse(response.is_async)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['books']), 3)
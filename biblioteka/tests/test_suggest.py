@@ -0,0 +1,26 @@
+from django.test import TestCase
+
+from biblioteka import catalog_cache, suggest
+from biblioteka.models import Book
+
+
+class SuggestIndexTests(TestCase):
+    def setUp(self):
+        suggest.prefix_index.reset()
+        self.addCleanup(suggest.prefix_index.reset)
+        self.book = Book.objects.create(title='Война и мир', isbn='978-5-00000-001-0')
+
+    def _titles(self, query):
+        return [item['title'] for item in suggest.suggest_books(query)]
+
+    def test_change_from_other_process_rebuilds_index(self):
+        self.assertEqual(self._titles('вой'), ['Война и мир'])
+
+        # Другой процесс переименовал книгу: сигналы этого процесса не срабатывают
+        Book.objects.filter(pk=self.book.pk).update(title='Анна Каренина')
+        self.assertEqual(self._titles('вой'), ['Война и мир'])
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_cache.bump(suggest.VERSION_SCOPE)
+
+        self.assertEqual(self._titles('вой'), [])
+        self.assertEqual(self._titles('анна'), ['Анна Каренина'])
@@ -16,8 +16,13 @@ urlpatterns = [
 
     path('api/rooms/', get_rooms, name='api_rooms'),
     path('api/availability/', get_availability, name='api_availability'),
+    path('api/availability/events/', availability_events, name='api_availability_events'),
     path('api/book/', create_booking, name='api_book'),
+    path('api/book/batch/', create_bookings_batch, name='api_book_batch'),
     path('api/books/', api_books, name='api_books'),
+    path('api/books/suggest/', api_books_suggest, name='api_books_suggest'),
+    path('api/categories/tree/', api_categories_tree, name='api_categories_tree'),
+    path('api/books/cache-stats/', api_books_cache_stats, name='api_books_cache_stats'),
     path('loans/<int:loan_id>/mark-lost/', mark_book_lost, name='mark_book_lost'),
     path('loans/<int:loan_id>/pay-fine/', create_payment, name='pay_fine'),
     path('fines/<int:fine_id>/status/', check_fine_status, name='check_fine_status'),
@@ -26,5 +31,7 @@ urlpatterns = [
     path('books/<int:book_id>/', book_detail, name='book_detail'),
     path('books/<int:book_id>/book/', book_book, name='book_book'),
     path('books/booking/<int:booking_id>/cancel/', cancel_book_booking, name='cancel_book_booking'),
+    path('books/<int:book_id>/queue/', join_book_queue, name='join_book_queue'),
+    path('books/queue/<int:entry_id>/leave/', leave_book_queue, name='leave_book_queue'),
 
 ]
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import json
 import uuid
@@ -10,6 +11,7 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.db.models import Sum
 from django.http import JsonResponse
 from django.shortcuts import render, redirect
@@ -21,14 +23,29 @@ from .models import Profile, BookLoan, RoomBooking, ReadingRoom, Category, Book,
 
 import json
 from datetime import datetime, time, timedelta
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods, require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 
 from .models import Branch, ReadingRoom, RoomBooking
+from . import book_queue, catalog_cache, fines, inventory, live
+from .availability import MAX_RANGE_DAYS, rooms_availability, rooms_availability_range
+from .book_fields import InvalidFields, parse_fields, project, serialize
+from .categories import category_tree, flatten_tree
+from .facets import facet_counts, filter_by_branch, filter_by_genre
+from .occupancy import booking_scope
+from .pagination import InvalidCursor, keyset_paginate, parse_limit
+from .room_ledger import MAX_BATCH_SIZE, BookingError, book_room, book_rooms, cancel_booking
+from .search import search_books
+from .streaming import CHUNK_SIZE as STREAM_CHUNK_SIZE, FORMATS as STREAM_FORMATS, streaming_response
+from .suggest import DEFAULT_LIMIT as DEFAULT_SUGGEST_LIMIT, MAX_LIMIT as MAX_SUGGEST_LIMIT, suggest_books
 from .utils import update_fine_status_from_yookassa, get_yookassa_auth_headers
 
 
@@ -39,16 +56,29 @@ def booking(request):
 
 
 def catalog(request):
+    # Счетчики всего каталога - та же запись кэша, что у первой страницы /api/books/ без фильтров
+    filters = catalog_cache.normalize_filters(None, None, '', None, None)
+    facets, facets_key = catalog_cache.get_facets(filters)
+    if facets is None:
+        facets = facet_counts()
+        catalog_cache.put_facets(facets_key, facets)
     branches = Branch.objects.filter(is_active=True)
-    genres = Category.objects.all()
+    # Жанры в порядке дерева, поджанры с отступом
+    genres = flatten_tree(category_tree())
+    for branch in branches:
+        branch.books_count = facets['branches'].get(branch.id, 0)
+    for genre in genres:
+        genre['books_count'] = facets['genres'].get(genre['id'], 0)
+        genre['label'] = '— ' * genre['depth'] + genre['name']
 
-    # Получаем все книги с авторами
-    books = Book.objects.prefetch_related('bookauthor_set__author').all()
+    # Первая страница книг, остальные подгружаются через /api/books/ при прокрутке
+    books, next_cursor = keyset_paginate(Book.objects.all())
 
     context = {
         'branches': branches,
         'genres': genres,
         'books': books,
+        'next_cursor': next_cursor,
     }
 
     return render(request, 'biblioteka/catalog.html', context)
@@ -66,43 +96,40 @@ def reg(request):
 def book(request, book_id):
     """Страница детальной информации о книге"""
     book = get_object_or_404(Book, id=book_id)
-
-    # Подсчет доступных экземпляров
     copies = BookCopy.objects.filter(book=book, status='active')
-    total_count = 0
-    for copy in copies:
-        total_count += copy.book_count  # Суммируем book_count
-
-    print(f"=== ДЕБАГ: Книга '{book.title}' ===")
-    print(f"Экземпляров в БД: {copies.count()}")
-    print(f"Всего книг (сумма): {total_count}")
 
-    # Проверяем брони пользователя
+    # Проверяем брони пользователя и его место в очереди
     has_active_booking = False
+    queue_entry = None
+    hold_deadline = None
     if request.user.is_authenticated:
-        has_active_booking = BookBooking.objects.filter(
+        has_active_booking = BookBooking.objects.active().filter(
             user=request.user,
             book_copy__book=book,
-            status__in=['pending', 'ready']
         ).exists()
+        queue_entry = book_queue.user_entries(request.user).filter(book=book).first()
+        if queue_entry is not None:
+            hold_deadline = book_queue.hold_deadline(queue_entry)
 
     # Категории книги
     book_categories = Category.objects.filter(
         bookcategory__book=book
     ).distinct()
 
-    # Похожие книги
+    # Похожие книги - предрасчитанные соседи (rebuild_similar_books)
     similar_books = Book.objects.filter(
-        bookcategory__category__in=book_categories
-    ).exclude(id=book.id).distinct()[:2]
+        similar_to__book=book
+    ).order_by('similar_to__rank')[:2]
 
     context = {
         'book': book,
-        'available_copies': total_count,  # Будет 40!
+        'available_copies': book.available_count,
         'available_book_copies': copies,
         'book_categories': book_categories,
         'similar_books': similar_books,
         'has_active_booking': has_active_booking,
+        'queue_entry': queue_entry,
+        'hold_deadline': hold_deadline,
     }
 
     # Используем СУЩЕСТВУЮЩИЙ шаблон book.html
@@ -182,6 +209,11 @@ def get_rooms(request):
     branch_id = request.GET.get('branch_id')
     if not branch_id:
         return JsonResponse({'rooms': []})
+    etag = catalog_cache.etag('rooms', branch_id, [f'rooms:branch:{branch_id}'])
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
     rooms = ReadingRoom.objects.filter(branch_id=branch_id, is_active=True)
     data = []
     for r in rooms:
@@ -191,7 +223,7 @@ def get_rooms(request):
             'total_seats': r.total_seats,
             'has_computers': r.has_computers,
         })
-    return JsonResponse({'rooms': data})
+    return _with_etag(JsonResponse({'rooms': data}), etag)
 
 @require_http_methods(["GET"])
 def get_availability(request):
@@ -200,20 +232,40 @@ def get_availability(request):
       branch - id филиала (branch id)
       hall - "reading" или "computer"
       date - YYYY-MM-DD
+      или date_from, date_to - YYYY-MM-DD, период до MAX_RANGE_DAYS дней
     Возвращает:
-      { rooms: [ {id, name, total_seats, slots: [{start, end, free}] }, ... ] }
+      { rooms: [ {id, name, total_seats, slot_minutes, slots: [{start, end, free}] }, ... ] }
+      для периода - { dates, rooms: [ {id, name, total_seats, slot_minutes, opens, free} ] },
+      где opens[день] - начало первого слота (null - зал закрыт), free[день][слот] - свободные места
     """
     branch_param = request.GET.get('branch')
     hall = request.GET.get('hall')  # "reading" или "computer"
     date_str = request.GET.get('date')
+    date_from_str = request.GET.get('date_from')
+    date_to_str = request.GET.get('date_to')
 
-    if not branch_param or not hall or not date_str:
+    if not branch_param or not hall or not (date_str or (date_from_str and date_to_str)):
         return HttpResponseBadRequest("Missing parameters")
 
     try:
-        booking_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        if date_str:
+            date_from = date_to = datetime.strptime(date_str, "%Y-%m-%d").date()
+        else:
+            date_from = datetime.strptime(date_from_str, "%Y-%m-%d").date()
+            date_to = datetime.strptime(date_to_str, "%Y-%m-%d").date()
     except ValueError:
         return HttpResponseBadRequest("Invalid date")
+    if date_to < date_from or (date_to - date_from).days >= MAX_RANGE_DAYS:
+        return HttpResponseBadRequest("Invalid date range")
+
+    # Ответ меняется только вместе с залами или бронями филиала
+    etag = catalog_cache.etag(
+        'availability', (branch_param, hall, date_str or '', date_from.isoformat(), date_to.isoformat()),
+        [f'rooms:branch:{branch_param}', booking_scope(branch_param)],
+    )
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
 
     # Найдём филиал
     try:
@@ -227,43 +279,56 @@ def get_availability(request):
     else:  # 'reading' or default
         rooms_qs = ReadingRoom.objects.filter(branch=branch, is_active=True, has_computers=False)
 
-    rooms_data = []
-
-    # Генерируем слоты с шагом 1 час от 08:00 до 20:00
-    start_hour = 8
-    end_hour = 17
-
-    for room in rooms_qs:
-        slots = []
-        for hour in range(start_hour, end_hour):
-            slot_start = time(hour=hour, minute=0)
-            slot_end = (datetime.combine(booking_date, slot_start) + timedelta(hours=1)).time()
-
-            # находим подтверждённые брони, которые пересекаются с этим слотом
-            overlapping = RoomBooking.objects.filter(
-                room=room,
-                booking_date=booking_date,
-                status='confirmed',
-                start_time__lt=slot_end,
-                end_time__gt=slot_start
-            )
-            occupied = sum(b.seats_count for b in overlapping)
-            free = max(room.total_seats - occupied, 0)
-
-            slots.append({
-                'start': slot_start.strftime("%H:%M"),
-                'end': slot_end.strftime("%H:%M"),
-                'free': free
-            })
+    # Все брони филиала на дату (период) загружаются одним запросом
+    if not date_str:
+        return _with_etag(JsonResponse(rooms_availability_range(rooms_qs, date_from, date_to)), etag)
+    rooms_data = rooms_availability(rooms_qs, date_from)
+
+    return _with_etag(JsonResponse({'rooms': rooms_data}), etag)
+# Интервал комментариев keepalive и пауза переподключения для SSE
+SSE_KEEPALIVE = 20
+SSE_RETRY_MS = 5000
+
+
+@require_GET
+async def availability_events(request):
+    """
+    SSE-поток изменений свободных мест филиала на дату (branch, date).
+    Событие slots: {room_id, slots: [{start, end, free}]} - изменившиеся слоты зала;
+    событие reset - доступность нужно перезагрузить целиком.
+    Работает только под ASGI (diplom.asgi, см. Procfile); под WSGI отвечает 204 и клиент не переподключается.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    try:
+        branch_id = int(request.GET.get('branch', ''))
+        day = datetime.strptime(request.GET.get('date', ''), "%Y-%m-%d").date()
+    except ValueError:
+        return HttpResponseBadRequest("Invalid parameters")
+
+    live.ensure_listener()
+    queue = live.broker.subscribe(branch_id, day)
+
+    async def events():
+        try:
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                event = 'reset' if message is live.RESET else 'slots'
+                yield f'event: {event}\ndata: {json.dumps(message)}\n\n'
+        finally:
+            live.broker.unsubscribe(branch_id, day, queue)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-        rooms_data.append({
-            'id': room.id,
-            'name': room.name,
-            'total_seats': room.total_seats,
-            'slots': slots
-        })
 
-    return JsonResponse({'rooms': rooms_data})
 @csrf_exempt
 @require_http_methods(["POST"])
 @login_required
@@ -272,12 +337,13 @@ def create_booking(request):
         data = json.loads(request.body.decode('utf-8'))
     except json.JSONDecodeError:
         return HttpResponseBadRequest("Invalid JSON")
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest("Invalid JSON")
 
     room_id = data.get('room_id')
     date_str = data.get('date')
     start_str = data.get('start')
     end_str = data.get('end')
-    seats = int(data.get('seats', 1))
 
     if not room_id or not date_str or not start_str or not end_str:
         return HttpResponseBadRequest("Missing fields")
@@ -287,7 +353,8 @@ def create_booking(request):
         booking_date = datetime.strptime(date_str, "%Y-%m-%d").date()
         start_time = datetime.strptime(start_str, "%H:%M").time()
         end_time = datetime.strptime(end_str, "%H:%M").time()
-    except ValueError:
+        seats = int(data.get('seats', 1))
+    except (TypeError, ValueError):
         return HttpResponseBadRequest("Invalid date/time format")
 
     # Не позволяем брони в прошлом
@@ -297,72 +364,211 @@ def create_booking(request):
 
     room = get_object_or_404(ReadingRoom, id=room_id)
 
-    # Считаем занятые места на пересекающие брони
-    overlapping = RoomBooking.objects.filter(
-        room=room,
-        booking_date=booking_date,
-        status='confirmed',
-        start_time__lt=end_time,
-        end_time__gt=start_time
-    )
-    occupied = sum(b.seats_count for b in overlapping)
-
-    if occupied + seats > room.total_seats:
-        return JsonResponse({'success': False, 'message': 'Недостаточно свободных мест в этом слоте'}, status=400)
-
-    # Дополнительная проверка: у пользователя уже может быть бронь в тот же интервал
-    user_conflict = RoomBooking.objects.filter(
-        user=request.user,
-        booking_date=booking_date,
-        status='confirmed',
-        start_time__lt=end_time,
-        end_time__gt=start_time
-    ).exists()
-    if user_conflict:
-        return JsonResponse({'success': False, 'message': 'У вас уже есть бронь в этот интервал'}, status=400)
-
-    # Создаём бронь
-    booking = RoomBooking.objects.create(
-        user=request.user,
-        room=room,
-        booking_date=booking_date,
-        start_time=start_time,
-        end_time=end_time,
-        seats_count=seats,
-        status='confirmed'
-    )
+    # Места списываются через учет слотов атомарно, без пересчета броней зала
+    try:
+        booking = book_room(request.user, room, booking_date, start_time, end_time, seats)
+    except BookingError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
 
     return JsonResponse({'success': True, 'booking_id': booking.id})
 
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required
+def create_bookings_batch(request):
+    """
+    Несколько броней одним запросом.
+    Тело: {"items": [{room_id, date, start, end, seats}, ...], "partial": false}
+    partial=false - все или ничего, true - создаются брони, прошедшие проверку.
+    Возвращает: {success, bookings: [{index, booking_id}], errors: [{index, message}]}
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return HttpResponseBadRequest("Invalid JSON")
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest("Invalid JSON")
+
+    raw_items = data.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        return HttpResponseBadRequest("Missing items")
+    if len(raw_items) > MAX_BATCH_SIZE:
+        return HttpResponseBadRequest(f"Too many items (max {MAX_BATCH_SIZE})")
+    partial = bool(data.get('partial', False))
+
+    # Разбираем элементы; залы загружаются одним запросом
+    parsed = []
+    for raw in raw_items:
+        try:
+            parsed.append((
+                int(raw['room_id']),
+                datetime.strptime(raw['date'], "%Y-%m-%d").date(),
+                datetime.strptime(raw['start'], "%H:%M").time(),
+                datetime.strptime(raw['end'], "%H:%M").time(),
+                int(raw.get('seats', 1)),
+            ))
+        except (KeyError, TypeError, ValueError):
+            return HttpResponseBadRequest("Invalid item format")
+
+    rooms = ReadingRoom.objects.in_bulk({room_id for room_id, _, _, _, _ in parsed})
+    now_date = datetime.now().date()
+    items, item_indexes, errors = [], [], {}
+    for index, (room_id, booking_date, start_time, end_time, seats) in enumerate(parsed):
+        if room_id not in rooms:
+            errors[index] = 'Зал не найден'
+        elif booking_date < now_date:
+            errors[index] = 'Нельзя бронировать на прошедшую дату'
+        else:
+            items.append((rooms[room_id], booking_date, start_time, end_time, seats))
+            item_indexes.append(index)
+
+    created = {}
+    if items and (partial or not errors):
+        created, item_errors = book_rooms(request.user, items, partial=partial)
+        errors.update({item_indexes[i]: message for i, message in item_errors.items()})
+        created = {item_indexes[i]: booking for i, booking in created.items()}
+
+    success = bool(created) and (partial or not errors)
+    return JsonResponse({
+        'success': success,
+        'bookings': [{'index': index, 'booking_id': booking.id} for index, booking in sorted(created.items())],
+        'errors': [{'index': index, 'message': message} for index, message in sorted(errors.items())],
+    }, status=200 if success else 400)
+
+def _matched_books(search):
+    """Книги, подходящие под поисковый запрос, до фильтров по филиалу и жанру"""
+    books = Book.objects.all()
+    if search:
+        # Ранжированный поиск по названию, авторам, категориям и описанию
+        books = search_books(books, search)
+    return books
+
+
+def _stream_books(books, search, fields, fmt, asynchronous):
+    """
+    Вся выборка без пагинации и кэша: книги читаются из базы пачками,
+    авторы и остатки берутся из денормализованных полей без доп. запросов.
+    """
+    ordering = ('-search_rank', 'id') if search else ('id',)
+    rows = project(books, fields).order_by(*ordering)
+    items = (serialize(row, fields) for row in rows.iterator(chunk_size=STREAM_CHUNK_SIZE))
+    return streaming_response(items, fmt, 'books', STREAM_CHUNK_SIZE, asynchronous)
+
+
 @require_GET
 def api_books(request):
+    """
+    Страница каталога (keyset-пагинация, кэш, ETag).
+    fields=title,pages,... - набор полей книги (по умолчанию поля карточки каталога).
+    stream=json|ndjson - вся выборка потоком, без пагинации.
+    """
     branch_id = request.GET.get('branch')
     genre_id = request.GET.get('genre')
     search = request.GET.get('search', '').strip()
 
-    books = Book.objects.all()
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        return HttpResponseBadRequest(str(e))
+
+    stream = request.GET.get('stream')
+    if stream:
+        if stream not in STREAM_FORMATS:
+            return HttpResponseBadRequest("Invalid stream format")
+        books = filter_by_genre(filter_by_branch(_matched_books(search), branch_id), genre_id)
+        # Под ASGI синхронный поток был бы собран в память целиком
+        return _stream_books(books, search, fields, stream, isinstance(request, ASGIRequest))
 
-    if branch_id and branch_id != 'all':
-        books = books.filter(bookcopy__branch_id=branch_id).distinct()
+    try:
+        limit = parse_limit(request.GET.get('limit'))
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+
+    filters = catalog_cache.normalize_filters(branch_id, genre_id, search, request.GET.get('cursor'), limit, fields)
+
+    matched = None
+    payload, cache_key, page_etag = catalog_cache.get(filters)
+    cache_hit = payload is not None
+    if payload is None:
+        matched = _matched_books(search)
+        books = filter_by_genre(filter_by_branch(matched, branch_id), genre_id)
+
+        # Keyset-пагинация по стабильному ключу сортировки
+        ordering = ('-search_rank', 'id') if search else ('id',)
+        rows = project(books, fields, extra=[name.lstrip('-') for name in ordering])
+        try:
+            rows, next_cursor = keyset_paginate(rows, ordering, request.GET.get('cursor'), limit)
+        except InvalidCursor as e:
+            return HttpResponseBadRequest(str(e))
 
-    if genre_id and genre_id != 'all':
-        books = books.filter(bookcategory__category_id=genre_id).distinct()
+        data = [serialize(row, fields) for row in rows]
 
-    if search:
-        books = books.filter(title__icontains=search)  # можно добавить author__full_name__icontains через BookAuthor
+        payload = {'books': data, 'next': next_cursor}
+        page_etag = catalog_cache.put(cache_key, payload, [item['id'] for item in data])
+
+    # Счетчики фильтров нужны только для первой страницы
+    first_page = not request.GET.get('cursor')
+    if first_page:
+        facets, facets_key = catalog_cache.get_facets(filters)
+        page_etag = catalog_cache.combine_etags(page_etag, facets_key)
+
+    # Клиент уже видел эту версию выдачи - счетчики можно не пересчитывать
+    not_modified = _not_modified(request, page_etag)
+    if not_modified is not None:
+        return not_modified
+
+    if first_page:
+        if facets is None:
+            cache_hit = False
+            if matched is None:
+                matched = _matched_books(search)
+            facets = facet_counts(matched if search else None, branch_id, genre_id)
+            catalog_cache.put_facets(facets_key, facets)
+        payload = {**payload, 'facets': facets}
+
+    response = _with_etag(JsonResponse(payload), page_etag)
+    response['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+    return response
+
+
+def _not_modified(request, etag):
+    """Ответ 304, если у клиента актуальная версия (If-None-Match), иначе None"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def _with_etag(response, etag):
+    # no-cache: браузер хранит ответ, но перед использованием переспрашивает сервер
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+def api_books_suggest(request):
+    """Подсказки для строки поиска по префиксу названия или автора"""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_SUGGEST_LIMIT)), 1), MAX_SUGGEST_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit")
+
+    return JsonResponse({'suggestions': suggest_books(query, limit)})
 
-    data = []
-    for book in books:
-        data.append({
-            'id': book.id,
-            'title': book.title,
-            'authors': book.get_authors_display(),
-            'description': book.description[:300],  # длина краткого описания
-            'publication_year': book.publication_year,
-            'pages': book.pages,
-        })
 
-    return JsonResponse({'books': data})
+@require_GET
+def api_categories_tree(request):
+    """Иерархия жанров для фильтров каталога"""
+    return JsonResponse({'categories': category_tree()})
+
+
+@staff_member_required
+@require_GET
+def api_books_cache_stats(request):
+    """Счетчики кэша каталога для текущего процесса"""
+    return JsonResponse(catalog_cache.stats())
 
 
 @login_required
@@ -374,23 +580,15 @@ def create_payment(request, loan_id):
     loan = get_object_or_404(BookLoan, id=loan_id, user=request.user, status='lost')
     print(f"Книга: {loan.book_copy.book.title}")
 
-    # Ищем или создаем неоплаченный штраф
-    fine = Fine.objects.filter(loan=loan, status='unpaid').first()
-    if not fine:
-        book_price = loan.book_copy.book.price
-        if not book_price or book_price <= 0:
-            book_price = Decimal('500.00')
-
-        fine = Fine.objects.create(
-            user=request.user,
-            loan=loan,
-            amount=book_price,
-            reason=f"Утеря книги: {loan.book_copy.book.title}",
-            status='unpaid'
-        )
-        print(f"Создан новый штраф ID: {fine.id}, сумма: {fine.amount}")
-    else:
-        print(f"Найден существующий штраф ID: {fine.id}, сумма: {fine.amount}")
+    # Неоплаченный штраф выдачи: создается или пересчитывается по политике штрафов
+    fine = fines.assess_loan(loan)
+    if fine is None:
+        # Начислять нечего (штраф списан или политика не штрафует)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'success': False, 'error': 'Неоплаченный штраф не найден'}, status=404)
+        messages.error(request, "Неоплаченный штраф не найден")
+        return redirect('profile')
+    print(f"Штраф ID: {fine.id}, сумма: {fine.amount}")
 
     # Форматируем сумму для ЮKassa
     amount_str = str(fine.amount.quantize(Decimal('0.00')))
@@ -552,21 +750,20 @@ def mark_book_lost(request, loan_id):
 
     # Проверяем, можно ли пометить как утерянную
     if loan.status in ['active', 'overdue']:
-        loan.status = 'lost'
-        loan.save()
+        with transaction.atomic():
+            loan.status = 'lost'
+            loan.save()
 
-        # Создаем запись о штрафе
-        fine = Fine.objects.create(
-            user=request.user,
-            loan=loan,
-            amount=loan.book_copy.book.price or Decimal('500.00'),
-            reason=f"Утеря книги: {loan.book_copy.book.title}",
-            status='unpaid'
-        )
+            # Штраф за утерю заменяет начисленную пеню за просрочку
+            fine = fines.assess_loan(loan)
+            if fine is None:
+                # Без штрафа утерю оформляет библиотекарь
+                transaction.set_rollback(True)
+                return JsonResponse({'success': False, 'error': 'Не удалось начислить штраф за утерю'}, status=400)
 
         return JsonResponse({
             'success': True,
-            'book_price': float(loan.book_copy.book.price or 500),
+            'book_price': float(fine.amount),
             'fine_id': fine.id
         })
 
@@ -576,11 +773,8 @@ def mark_book_lost(request, loan_id):
 def cancel_booking_view(request, booking_id):
     """Простое удаление бронирования через AJAX"""
     try:
-        # Находим бронирование текущего пользователя
-        booking = get_object_or_404(RoomBooking, id=booking_id, user=request.user)
-
-        # Просто удаляем - никаких лишних проверок
-        booking.delete()
+        # Удаляем бронирование текущего пользователя и возвращаем места в учет слотов
+        cancel_booking(booking_id, request.user)
 
         return JsonResponse({
             'success': True
@@ -595,28 +789,25 @@ def cancel_booking_view(request, booking_id):
 
 
 def book_detail(request, book_id):
-    """Жестко фиксированная версия"""
+    """Детальная информация о книге"""
     book = get_object_or_404(Book, id=book_id)
 
-    # Жестко фиксируем значение для теста
-    total_count = 40
-
-    # Или из базы, но с проверкой
-    try:
-        copy = BookCopy.objects.get(book=book, status='active')
-        total_count = copy.book_count
-    except BookCopy.DoesNotExist:
-        total_count = 0
-    except BookCopy.MultipleObjectsReturned:
-        total_count = sum(c.book_count for c in BookCopy.objects.filter(book=book, status='active'))
-
     context = {
         'book': book,
-        'available_copies': total_count,  # Гарантированно число
+        'available_copies': book.available_count,  # Гарантированно число
         'test_value': 123,  # Тестовая переменная
     }
 
     return render(request, 'biblioteka/book_detail.html', context)
+def _posted_branch(request):
+    """Необязательный филиал из JSON-тела или формы ({"branch": id})"""
+    if request.content_type == 'application/json':
+        branch = json.loads(request.body.decode('utf-8') or '{}').get('branch')
+    else:
+        branch = request.POST.get('branch')
+    return int(branch) if branch else None
+
+
 @login_required
 def book_book(request, book_id):
     """Бронирование книги"""
@@ -624,10 +815,9 @@ def book_book(request, book_id):
         book = get_object_or_404(Book, id=book_id)
 
         # Проверяем, есть ли у пользователя уже бронь на эту книгу
-        existing_booking = BookBooking.objects.filter(
+        existing_booking = BookBooking.objects.active().filter(
             user=request.user,
             book_copy__book=book,
-            status__in=['pending', 'ready']  # активные брони
         ).exists()
 
         if existing_booking:
@@ -636,32 +826,43 @@ def book_book(request, book_id):
                 'error': 'У вас уже есть активная бронь на эту книгу'
             })
 
-        # Находим доступный экземпляр
-        book_copy = BookCopy.objects.filter(
-            book=book,
-            status='active'
-        ).first()
-
-        if not book_copy:
-            return JsonResponse({
-                'success': False,
-                'error': 'Нет доступных экземпляров книги'
-            })
-
-        # Создаем бронирование
-        from django.utils import timezone
-        booking = BookBooking.objects.create(
-            user=request.user,
-            book_copy=book_copy,
-            branch=book_copy.branch,
-            status='ready',
-            ready_by=timezone.now(),
-            pickup_deadline=timezone.now() + timedelta(days=3)  # 3 дня на забрать
-        )
-
-        # Меняем статус экземпляра (но не 'returned'!)
-        book_copy.status = 'active'  # оставляем активным
-        book_copy.save()
+        try:
+            branch_id = _posted_branch(request)
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Неверный запрос'}, status=400)
+
+        booking = None
+        with transaction.atomic():
+            held_branch_id = book_queue.claim(request.user, book.id)
+            if held_branch_id is not None:
+                # Экземпляр отложен для пользователя из очереди и уже списан из available
+                branch_id = held_branch_id
+            else:
+                # Экземпляр списывается условным UPDATE счетчика филиала - последний не уйдет двоим.
+                # Отложенные для очереди экземпляры в available не входят
+                try:
+                    branch_id = inventory.reserve(book.id, branch_id)
+                except inventory.InventoryError as e:
+                    return JsonResponse({'success': False, 'error': str(e)})
+
+            book_copy = BookCopy.objects.filter(book=book, branch_id=branch_id, status='active').first()
+            if book_copy is None:
+                # Счетчик разошелся с экземплярами: списание откатывается
+                transaction.set_rollback(True)
+            else:
+                booking = BookBooking.objects.create(
+                    user=request.user,
+                    book_copy=book_copy,
+                    branch_id=branch_id,
+                    status='ready',
+                    ready_by=timezone.now(),
+                    pickup_deadline=timezone.now() + timedelta(days=3)  # 3 дня на забрать
+                )
+
+        if booking is None:
+            # Пересчет после отката: внутри откатываемого блока он бы пропал вместе с ним
+            inventory.rebuild([(book.id, branch_id)])
+            return JsonResponse({'success': False, 'error': 'Нет доступных экземпляров книги'})
 
         return JsonResponse({
             'success': True,
@@ -685,15 +886,49 @@ def cancel_book_booking(request, booking_id):
                 'error': 'Невозможно отменить это бронирование'
             })
 
-        # Освобождаем экземпляр книги
-        book_copy = booking.book_copy
-        book_copy.status = 'active'  # Делаем снова доступной
-        book_copy.save()
+        with transaction.atomic():
+            # Освобождаем экземпляр книги
+            book_copy = booking.book_copy
+            book_copy.status = 'active'  # Делаем снова доступной
+            book_copy.save()
+
+            # Меняем статус брони: экземпляр вернется в учет и достанется первому в очереди (сигналы)
+            booking.status = 'cancelled'
+            booking.save()
+
+        return JsonResponse({'success': True})
+
+    return JsonResponse({'success': False, 'error': 'Неверный запрос'})
+
+
+@login_required
+def join_book_queue(request, book_id):
+    """Постановка в очередь на книгу (в филиале, если он передан)"""
+    if request.method == 'POST':
+        try:
+            branch_id = _posted_branch(request)
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Неверный запрос'}, status=400)
 
-        # Меняем статус брони
-        booking.status = 'cancelled'
-        booking.save()
+        try:
+            entry = book_queue.enqueue(request.user, book_id, branch_id)
+        except book_queue.QueueError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
 
+        rank = book_queue.user_entries(request.user).get(pk=entry.pk).rank
+        return JsonResponse({'success': True, 'entry_id': entry.id, 'position': rank, 'status': entry.status})
+
+    return JsonResponse({'success': False, 'error': 'Неверный запрос'})
+
+
+@login_required
+def leave_book_queue(request, entry_id):
+    """Выход из очереди на книгу"""
+    if request.method == 'POST':
+        try:
+            book_queue.dequeue(request.user, entry_id)
+        except book_queue.QueueError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
         return JsonResponse({'success': True})
 
     return JsonResponse({'success': False, 'error': 'Неверный запрос'})